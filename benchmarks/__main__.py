@@ -0,0 +1,243 @@
+"""Benchmarks of tftui's hot paths, run from the repository root:
+
+    python -m benchmarks [state|plan|events|search|surgery]...
+    python -m benchmarks sources        (from a terraform root)
+    python -m benchmarks commands [EXECUTABLE]  (needs terraform, works on a scratch state)
+"""
+
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import contextmanager
+from tftui.events import EventStream
+from tftui.operations import plan_operations, run_operations
+from tftui.plan import PlanModel, style_line
+from tftui.search import SearchIndex
+from tftui.state import State, StateParser
+from tftui.surgery import StateSurgery, count_instances
+from benchmarks.synthetic import (
+    parse_state,
+    synthetic_document,
+    synthetic_events,
+    synthetic_instances,
+    synthetic_plan,
+    synthetic_state,
+)
+
+
+class Measurement:
+    seconds = 0.0
+    memory = 0
+    peak = 0
+
+    def __str__(self) -> str:
+        if self.seconds < 0.1:
+            elapsed = f"{self.seconds * 1000:.2f}ms"
+        else:
+            elapsed = f"{self.seconds:.3f}s"
+        if not self.peak:
+            return elapsed
+        return (
+            f"{elapsed}, {self.memory / 2**20:.1f}MB (peak {self.peak / 2**20:.1f}MB)"
+        )
+
+
+@contextmanager
+def measure(memory=False):
+    """Times the block, and traces the memory it allocates (which slows it down) if asked to"""
+    measurement = Measurement()
+    if memory:
+        tracemalloc.start()
+    started = time.perf_counter()
+    try:
+        yield measurement
+    finally:
+        measurement.seconds = time.perf_counter() - started
+        if memory:
+            measurement.memory, measurement.peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+
+def benchmark_state() -> None:
+    # doubling the resource size should roughly double the parse time
+    for lines_per_resource in (12_500, 25_000, 50_000, 100_000):
+        with measure() as measurement:
+            parser = StateParser([])
+            for line in synthetic_state(3, lines_per_resource):
+                parser.feed(line)
+        print(f"3 resources x {lines_per_resource} lines: {measurement}")
+    instances = 100_000
+    with measure(memory=True) as measurement:
+        parse_state(synthetic_instances(instances))
+    print(
+        f"{instances} instances: {measurement}, {measurement.memory // instances} bytes per instance"
+    )
+
+
+def benchmark_plan() -> None:
+    # a linear model spends about the same time on each line, whatever the size of the plan
+    for size in (10_000, 50_000, 100_000, 200_000):
+        with measure() as streamed:
+            output = PlanModel()
+            block_color = ""
+            for line in synthetic_plan(size):
+                stylzed_line, block_color = style_line(line, block_color)
+                output.append(stylzed_line)
+        with measure() as views:
+            output.summary()
+            output.fulltext()
+        total = streamed.seconds + views.seconds
+        print(
+            f"{len(output.lines)} lines: streamed in {streamed}, with views {total:.3f}s"
+            f" ({total / len(output.lines) * 1e6:.1f}us per line)"
+        )
+
+
+def benchmark_events() -> None:
+    for size in (1_000, 10_000, 100_000):
+        lines = list(synthetic_events(size))
+        with measure() as measurement:
+            stream = EventStream()
+            for line in lines:
+                stream.consume(line)
+        print(
+            f"{len(lines)} events: {measurement}"
+            f" ({measurement.seconds / len(lines) * 1e6:.1f}us per event)"
+        )
+
+
+def benchmark_search(instances=100_000) -> None:
+    state_tree = parse_state(synthetic_instances(instances))
+    with measure(memory=True) as measurement:
+        index = SearchIndex().build(state_tree)
+    print(
+        f"{instances} instances indexed: {measurement}, {len(index.lines)} lines, "
+        f"{len(index.postings)} trigrams, {index.size} postings"
+    )
+    with measure() as measurement:
+        SearchIndex().build(state_tree)
+    print(f"{instances} instances indexed without tracing memory: {measurement}")
+    for query in ("a", "zone-3", "record-4242", "Z0123456789_RECORD-99999", "missing"):
+        with measure() as measurement:
+            matches = index.search(query)
+        print(f"{query!r}: {len(matches)} blocks in {measurement}")
+
+
+def benchmark_surgery(instances=5_000, operations=300) -> None:
+    # in process only: editing the pulled state, without terraform's reads and writes
+    addresses = [
+        f'module.zone["zone-{i % 10}"].aws_route53_record.this["record-{i}"]'
+        for i in range(operations)
+    ]
+    with measure() as measurement:
+        surgery = StateSurgery()
+        surgery.document = synthetic_document(instances)
+        for address in addresses:
+            surgery.add(StateSurgery.RM, address)
+        surgery.apply()
+    print(f"{operations} rm applied in memory on {instances} instances: {measurement}")
+
+
+def scratch_state(instances: int) -> None:
+    with open("terraform.tfstate", "w") as file:
+        json.dump(
+            dict(synthetic_document(instances), terraform_version="1.0.0"),
+            file,
+            indent=2,
+        )
+
+
+def remaining_instances() -> int:
+    with open("terraform.tfstate") as file:
+        return count_instances(json.load(file))
+
+
+async def benchmark_commands(
+    executable="terraform", instances=1_000, operations=100
+) -> None:
+    # per-resource terraform commands against a single surgery push, on a scratch local state
+    addresses = [
+        f'module.zone["zone-{i % 10}"].aws_route53_record.this["record-{i}"]'
+        for i in range(operations)
+    ]
+    commands = (
+        # what `d` ran before the batch path: one `state rm` per resource
+        ("delete", [[address] for address in addresses]),
+        # what `d` runs now without state surgery: `state rm` chunked by command line length
+        ("delete", [addresses]),
+        # taint and untaint always take one address per command
+        ("taint", [addresses]),
+    )
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as scratch:
+        os.chdir(scratch)
+        try:
+            for action, batches in commands:
+                scratch_state(instances)
+                failures = {}
+                with measure() as measurement:
+                    for batch in batches:
+                        failures.update(await run_operations(executable, action, batch))
+                invocations = sum(
+                    len(plan_operations(action, batch)) for batch in batches
+                )
+                print(
+                    f"{operations} {action} in {invocations} terraform commands on {instances} instances:"
+                    f" {measurement}, {len(failures)} failed, {remaining_instances()} instances left"
+                )
+            for action in (StateSurgery.RM, StateSurgery.TAINT):
+                scratch_state(instances)
+                with measure() as measurement:
+                    surgery = StateSurgery(executable)
+                    await surgery.pull()
+                    for address in addresses:
+                        surgery.add(action, address)
+                    await surgery.push()
+                print(
+                    f"{operations} {action} in one surgery pull + push on {instances} instances:"
+                    f" {measurement}, {remaining_instances()} instances left"
+                )
+        finally:
+            os.chdir(cwd)
+
+
+async def benchmark_sources(executable="terraform") -> None:
+    # compares how long each state source takes to load, and to render every block
+    for source in State.SOURCES:
+        state = State(executable=executable, source=source)
+        with measure() as loaded:
+            await state.refresh_state()
+        with measure() as rendered:
+            for block in state.state_tree.values():
+                block.contents
+        print(
+            f"{source}: {len(state.state_tree)} blocks loaded in {loaded}, rendered in {rendered}"
+        )
+
+
+BENCHMARKS = {
+    "state": benchmark_state,
+    "plan": benchmark_plan,
+    "events": benchmark_events,
+    "search": benchmark_search,
+    "surgery": benchmark_surgery,
+}
+
+
+if __name__ == "__main__":
+    arguments = sys.argv[1:]
+    if arguments == ["sources"]:
+        asyncio.run(benchmark_sources())
+    elif arguments[:1] == ["commands"] and len(arguments) <= 2:
+        asyncio.run(benchmark_commands(*arguments[1:]))
+    elif all(name in BENCHMARKS for name in arguments):
+        for name in arguments or BENCHMARKS:
+            print(f"== {name}")
+            BENCHMARKS[name]()
+    else:
+        print(__doc__)
+        exit(1)
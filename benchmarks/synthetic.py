@@ -0,0 +1,93 @@
+"""Synthetic terraform output of any size, for the benchmarks"""
+
+import json
+from tftui.state import StateParser
+
+
+def synthetic_state(resources: int, lines_per_resource: int):
+    for i in range(resources):
+        yield f"# aws_iam_policy.policy_{i}:\n"
+        yield f'resource "aws_iam_policy" "policy_{i}" {{\n'
+        for j in range(lines_per_resource):
+            yield f'    "statement_{j}" = "arn:aws:s3:::bucket-{j}/*"\n'
+        yield "}\n"
+        yield "\n"
+
+
+def synthetic_instances(instances: int):
+    for i in range(instances):
+        yield f'# module.dns.module.zone["zone-{i % 10}"].aws_route53_record.this["record-{i}"]:\n'
+        yield 'resource "aws_route53_record" "this" {\n'
+        yield f'    id      = "Z0123456789_record-{i}_A"\n'
+        yield '    name    = "example.com"\n'
+        yield "    ttl     = 300\n"
+        yield '    type    = "A"\n'
+        yield "}\n"
+        yield "\n"
+
+
+def parse_state(lines) -> dict:
+    """The state tree of `terraform show` output"""
+    state_tree = {}
+    parser = StateParser([])
+    for line in lines:
+        parsed = parser.feed(line)
+        if parsed is not None:
+            state_tree[parsed[0]] = parsed[1]
+    return state_tree
+
+
+def synthetic_plan(lines: int):
+    """Yields the output of a plan that updates resources until it is `lines` long"""
+    yield "Terraform will perform the following actions:"
+    yield ""
+    count = 0
+    while count * 6 + 4 < lines:
+        yield f'  # module.zone["zone-{count % 10}"].aws_route53_record.this["record-{count}"] will be updated in-place'
+        yield '  ~ resource "aws_route53_record" "this" {'
+        yield f"      ~ ttl     = 300 -> {count}"
+        yield f'      + records = ["10.0.{count % 256}.{count % 100}"]'
+        yield "    }"
+        yield ""
+        count += 1
+    yield f"Plan: 0 to add, {count} to change, 0 to destroy."
+
+
+def synthetic_events(resources: int):
+    """Yields the event lines of an apply that creates `resources` resources, reporting progress"""
+    for i in range(resources):
+        hook = {"resource": {"addr": f'aws_route53_record.this["record-{i}"]'}}
+        yield json.dumps({"type": "apply_start", "hook": {**hook, "action": "create"}})
+        for elapsed in (10, 20):
+            yield json.dumps(
+                {"type": "apply_progress", "hook": {**hook, "elapsed_seconds": elapsed}}
+            )
+        yield json.dumps(
+            {"type": "apply_complete", "hook": {**hook, "elapsed_seconds": 25}}
+        )
+
+
+def synthetic_document(instances: int) -> dict:
+    """A state file of `instances` route53 records, spread over ten module instances"""
+    return {
+        "version": 4,
+        "serial": 1,
+        "lineage": "benchmark",
+        "resources": [
+            {
+                "module": f'module.zone["zone-{zone}"]',
+                "mode": "managed",
+                "type": "aws_route53_record",
+                "name": "this",
+                "provider": 'provider["registry.terraform.io/hashicorp/aws"]',
+                "instances": [
+                    {
+                        "index_key": f"record-{i}",
+                        "attributes": {"id": f"Z0123456789_record-{i}_A", "ttl": 300},
+                    }
+                    for i in range(zone, instances, 10)
+                ],
+            }
+            for zone in range(10)
+        ],
+    }
@@ -1,23 +1,31 @@
 import argparse
+import asyncio
 import json
 import os
 import platform
-import pyperclip
 import re
-import subprocess
+import time
 import traceback
 from asyncio import CancelledError
+from concurrent.futures import ThreadPoolExecutor
 from rich.text import Text
 from shutil import which
 from tftui.apis import OutboundAPIs
-from tftui.plan import PlanScreen
+from tftui.cache import PlanCache, StateCache
+from tftui.cli import parse_command_line
+from tftui.commands import Command, execute_async
+from tftui.plan import PLAN_VIEWS, PlanScreen, PlanStatus, PlanTree
+from tftui.surgery import StateSurgery
+from tftui.operations import run_operations, error_summary
+from tftui.search import SearchIndex, FieldIndex, AttributeIndex, parse_query
 from tftui.debug_log import setup_logging
 from tftui.state import (
     State,
     Block,
-    execute_async,
-    split_resource_name,
     extract_sensitive_values,
+    iterate_json_resources,
+    diff_state_trees,
+    parse_module_path,
 )
 from tftui.modal import (
     HelpModal,
@@ -27,6 +35,7 @@ from tftui.modal import (
     WorkspaceModal,
 )
 from textual import work
+from textual.worker import get_current_worker
 from textual.app import App, Binding
 from textual.containers import Horizontal
 from textual.events import Key
@@ -42,6 +51,14 @@ from textual.widgets import (
 
 logger = setup_logging()
 
+SEARCH_DEBOUNCE = 0.15
+# instances of a single resource above this count are collapsed into a group node
+TREE_GROUP_THRESHOLD = 50
+TREE_PAGE_SIZE = 100
+# modules with more resources than this (including submodules) start collapsed
+TREE_EXPAND_THRESHOLD = 200
+WORKSPACE_COMMAND_TIMEOUT = 30
+
 
 class ApplicationGlobals:
     executable = "terraform"
@@ -49,6 +66,12 @@ class ApplicationGlobals:
     no_init = False
     darkmode = True
     var_file = None
+    state_source = State.SOURCE_SHOW
+    use_cache = True
+    batch_state = False
+    json_events = False
+    check_version = True
+    started = None
 
 
 class AppHeader(Horizontal):
@@ -67,66 +90,530 @@ Workspace:
     BORDER_TITLE = "TFTUI - the Terraform terminal user interface"
 
     info = Static("", classes="header-box")
+    workspace = ""
 
-    def refresh_info(self):
-        result = subprocess.run(
-            [ApplicationGlobals.executable, "workspace", "show"],
-            capture_output=True,
-            text=True,
-        )
-
-        if result.returncode == 0:
-            workspace = result.stdout
+    @work(exclusive=True, group="header")
+    async def refresh_info(self):
+        self.workspace = ""
+        self.update_info()
+        try:
+            returncode, stdout = await execute_async(
+                ApplicationGlobals.executable,
+                "workspace",
+                "show",
+                timeout=WORKSPACE_COMMAND_TIMEOUT,
+            )
+        except TimeoutError as e:
+            returncode, stdout = (None, str(e))
+        if returncode == 0:
+            self.workspace = stdout
         else:
-            logger.error(f"Error getting workspace: {result.stderr}")
-            workspace = "Unknown"
+            logger.error(f"Error getting workspace: {stdout}")
+            self.workspace = "Unknown"
+        self.update_info()
 
+    def update_info(self) -> None:
         self.info.update(
             f"""{OutboundAPIs.version}{' (new version available)' if OutboundAPIs.is_new_version_available else ''}\n
 {os.getcwd()}\n
-{workspace}"""
+{self.workspace}"""
         )
 
-    def compose(self):
+    def on_mount(self) -> None:
         self.refresh_info()
+
+    def compose(self):
         yield Static(self.TITLES, classes="header-box")
         yield self.info
         yield Static(self.LOGO, classes="header-box")
 
 
+class TreeModule:
+    """The submodules and blocks of a module, kept apart from the (lazily created) tree nodes
+
+    Blocks are kept by name, so nodes are created from the state the tree shows even while a
+    refresh streams the next one.
+    """
+
+    __slots__ = ("submodules", "blocks")
+
+    def __init__(self):
+        self.submodules = []
+        self.blocks = {}
+
+
+class BlockGroup:
+    """Data of a node standing for many instances of a resource, or for a page of them"""
+
+    __slots__ = ("key", "label", "module", "fullnames")
+
+    def __init__(self, key: str, label: str, module: str, fullnames: list):
+        self.key = key
+        self.label = label
+        self.module = module
+        self.fullnames = fullnames
+
+
 class StateTree(Tree):
     current_node = None
     highlighted_resource_node = []
-    selected_nodes = []
+    # the names of the selected resources, in the order they were selected
+    selected_resources = {}
     current_state = []
     sensitive_values = {}
+    refreshing = False
+    stale = False
+    # only the first load shows the last cached state, an empty state is a state like any other
+    first_load = True
+    search_string = ""
+    search_matches = None
+    search_index = None
+    field_index = None
+    attribute_index = None
+    indexing_attributes = False
+    current_state_json = None
+    module_nodes = {}
+    resource_nodes = {}
+    tree_model = {}
+    populated_nodes = set()
+    # searches and index updates run one after the other on this thread, so a search never
+    # reads an index halfway through an update
+    index_thread = ThreadPoolExecutor(max_workers=1, thread_name_prefix="index")
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.current_state = State(
-            executable=ApplicationGlobals.executable, no_init=ApplicationGlobals.no_init
-        )
+        self.current_state = self.new_state()
         self.guide_depth = 3
         self.root.data = ""
 
-    def build_tree(self, search_string="") -> None:
-        self.clear()
-        self.selected_nodes = []
-        self.current_node = None
-        module_nodes = {}
-
-        filtered_blocks = dict(
-            filter(
-                lambda block: search_string in block[1].contents
-                or search_string in block[1].name
-                or search_string in block[1].submodule,
-                self.current_state.state_tree.items(),
+    def clear(self):
+        self.module_nodes = {}
+        self.resource_nodes = {}
+        self.populated_nodes = set()
+        return super().clear()
+
+    def add_to_model(self, fullname: str, block: Block) -> None:
+        module_path = block.address.module_path
+        for depth in range(len(module_path) + 1):
+            module_fullname = ".".join(module_path[:depth])
+            if module_fullname not in self.tree_model:
+                self.tree_model[module_fullname] = TreeModule()
+                if depth > 0:
+                    parent = ".".join(module_path[: depth - 1])
+                    self.tree_model[parent].submodules.append(module_fullname)
+        self.tree_model[block.submodule].blocks[fullname] = block
+
+    def remove_from_model(self, fullname: str, block: Block) -> str:
+        """Removes a block and any module left empty; returns the topmost module that changed"""
+        module_fullname = block.submodule
+        del self.tree_model[module_fullname].blocks[fullname]
+        module_path = block.address.module_path
+        while module_path:
+            module = self.tree_model[module_fullname]
+            if module.blocks or module.submodules:
+                break
+            del self.tree_model[module_fullname]
+            module_path = module_path[:-1]
+            parent = ".".join(module_path)
+            self.tree_model[parent].submodules.remove(module_fullname)
+            module_fullname = parent
+        return module_fullname
+
+    def module_size(self, module_fullname: str, sizes: dict) -> int:
+        if module_fullname not in sizes:
+            module = self.tree_model[module_fullname]
+            sizes[module_fullname] = len(module.blocks) + sum(
+                self.module_size(submodule, sizes) for submodule in module.submodules
+            )
+        return sizes[module_fullname]
+
+    def module_items(self, module_fullname: str) -> list:
+        """Returns the block names of a module, with large instance sets as groups"""
+        resources = {}
+        for fullname, block in self.tree_model[module_fullname].blocks.items():
+            address = block.address
+            key = (address.mode, address.type, address.name)
+            resources.setdefault(key, []).append(fullname)
+        items = []
+        for (mode, type, name), fullnames in resources.items():
+            if len(fullnames) <= TREE_GROUP_THRESHOLD:
+                items.extend(fullnames)
+                continue
+            label = f"{'data.' if mode == 'data' else ''}{type}.{name}"
+            items.append(
+                BlockGroup(
+                    f"{module_fullname}:{label}",
+                    f"{label} [{len(fullnames)} instances]",
+                    module_fullname,
+                    fullnames,
+                )
+            )
+        return items
+
+    def add_module_node(self, parent_node, module_fullname: str):
+        node = parent_node.add(
+            parse_module_path(module_fullname)[-1], data=module_fullname
+        )
+        self.module_nodes[module_fullname] = node
+        return node
+
+    def add_block_node(self, parent_node, fullname: str, block: Block) -> None:
+        leaf = parent_node.add_leaf(block.name, data=block)
+        self.resource_nodes[fullname] = leaf
+        self.style_block_node(leaf, fullname)
+
+    def style_block_node(self, node, fullname: str) -> None:
+        label = Text(node.data.name)
+        if node.data.is_tainted:
+            label.stylize("gold3 strike")
+        if fullname in self.selected_resources:
+            label.stylize("red bold italic reverse")
+        node.set_label(label)
+
+    def populate(self, node) -> None:
+        """Creates the children of a module or group node the first time they are needed"""
+        if node.id in self.populated_nodes:
+            return
+        self.populated_nodes.add(node.id)
+        if isinstance(node.data, BlockGroup):
+            fullnames = node.data.fullnames
+            if len(fullnames) <= TREE_PAGE_SIZE:
+                blocks = self.tree_model[node.data.module].blocks
+                for fullname in fullnames:
+                    self.add_block_node(node, fullname, blocks[fullname])
+                return
+            for start in range(0, len(fullnames), TREE_PAGE_SIZE):
+                page = fullnames[start : start + TREE_PAGE_SIZE]
+                node.add(
+                    f"[{start}-{start + len(page) - 1}]",
+                    data=BlockGroup(
+                        f"{node.data.key}#{start}", "", node.data.module, page
+                    ),
+                )
+            return
+        module = self.tree_model.get(node.data)
+        if module is None:
+            return
+        existing = {child.data for child in node.children}
+        for submodule in module.submodules:
+            if submodule not in existing:
+                self.add_module_node(node, submodule)
+        for item in self.module_items(node.data):
+            if isinstance(item, BlockGroup):
+                node.add(item.label, data=item)
+            else:
+                self.add_block_node(node, item, module.blocks[item])
+
+    def forget_nodes(self, node) -> None:
+        for child in node.children:
+            self.forget_nodes(child)
+        self.populated_nodes.discard(node.id)
+        if isinstance(node.data, Block):
+            self.resource_nodes.pop(str(node.data.address), None)
+            if node in self.highlighted_resource_node:
+                self.highlighted_resource_node = []
+        elif isinstance(node.data, str):
+            self.module_nodes.pop(node.data, None)
+        if node is self.current_node:
+            self.current_node = None
+
+    def expanded_groups(self, node) -> set:
+        expanded = set()
+        for child in node.children:
+            if isinstance(child.data, BlockGroup) and child.is_expanded:
+                expanded.add(child.data.key)
+                expanded |= self.expanded_groups(child)
+        return expanded
+
+    def expand_groups(self, node, expanded: set) -> None:
+        for child in node.children:
+            if isinstance(child.data, BlockGroup) and child.data.key in expanded:
+                self.populate(child)
+                child.expand()
+                self.expand_groups(child, expanded)
+
+    def repopulate(self, node) -> None:
+        """Rebuilds the blocks of a populated module node, keeping its submodule nodes"""
+        expanded = self.expanded_groups(node)
+        for child in list(node.children):
+            if isinstance(child.data, str) and child.data in self.tree_model:
+                continue
+            self.forget_nodes(child)
+            child.remove()
+        self.populated_nodes.discard(node.id)
+        self.populate(node)
+        self.expand_groups(node, expanded)
+
+    def expand_module(self, node, max_size=None, sizes=None) -> None:
+        """Expands a module node and its submodules, down to modules larger than max_size"""
+        sizes = {} if sizes is None else sizes
+        self.populate(node)
+        node.expand()
+        for child in node.children:
+            if isinstance(child.data, str) and (
+                max_size is None or self.module_size(child.data, sizes) <= max_size
+            ):
+                self.expand_module(child, max_size, sizes)
+
+    def add_streamed_blocks(self, batch: list) -> None:
+        """Shows top level modules and a preview of root resources while the state loads"""
+        for fullname, block in batch:
+            self.add_to_model(fullname, block)
+            module_path = block.address.module_path
+            if not module_path:
+                if len(self.resource_nodes) < TREE_PAGE_SIZE:
+                    self.add_block_node(self.root, fullname, block)
+            elif module_path[0] not in self.module_nodes:
+                self.add_module_node(self.root, module_path[0])
+
+    def on_tree_node_expanded(self, event: Tree.NodeExpanded) -> None:
+        self.populate(event.node)
+
+    def patch_tree(self, previous_state_tree: dict, added, removed, changed) -> None:
+        """Updates only the nodes of blocks that were added, removed or changed"""
+        state_tree = self.current_state.state_tree
+        logger.debug(
+            "Patch tree: %s",
+            json.dumps(
+                {"added": len(added), "removed": len(removed), "changed": len(changed)},
+                indent=2,
+            ),
+        )
+        self.update_indexes(state_tree, added, removed, changed)
+        current_fullname = (
+            str(self.current_node.data.address)
+            if self.current_node is not None
+            and isinstance(self.current_node.data, Block)
+            else None
+        )
+        affected_modules = set()
+        for fullname in removed:
+            affected_modules.add(
+                self.remove_from_model(fullname, previous_state_tree[fullname])
+            )
+        for fullname in added:
+            block = state_tree[fullname]
+            known = block.submodule in self.tree_model
+            self.add_to_model(fullname, block)
+            affected_modules.add(block.submodule)
+            if not known:
+                # the first materialized ancestor has to show the new module
+                module_path = block.address.module_path
+                while ".".join(module_path) not in self.module_nodes and module_path:
+                    module_path = module_path[:-1]
+                affected_modules.add(".".join(module_path))
+        # unchanged blocks are new objects as well, the previous state is left behind
+        for fullname, block in state_tree.items():
+            self.tree_model[block.submodule].blocks[fullname] = block
+        for fullname, node in self.resource_nodes.items():
+            node.data = state_tree[fullname] if fullname in state_tree else node.data
+        for fullname in removed:
+            self.selected_resources.pop(fullname, None)
+        for fullname in changed:
+            if fullname in self.resource_nodes:
+                self.style_block_node(self.resource_nodes[fullname], fullname)
+        for module_fullname in affected_modules:
+            node = (
+                self.root
+                if module_fullname == ""
+                else self.module_nodes.get(module_fullname)
             )
+            if node is not None and node.id in self.populated_nodes:
+                self.repopulate(node)
+        if current_fullname is not None and current_fullname in self.resource_nodes:
+            self.current_node = self.resource_nodes[current_fullname]
+
+    def update_indexes(self, state_tree: dict, added, removed, changed) -> None:
+        """Queues the changes of a refresh behind any search that is running"""
+        indexes = [
+            index
+            for index in (self.search_index, self.field_index)
+            if index is not None
+        ]
+        # the blocks are taken now, the state tree may change again before the update runs
+        blocks = {fullname: state_tree[fullname] for fullname in added + changed}
+
+        def update():
+            try:
+                for index in indexes:
+                    index.update(blocks, added, removed, changed)
+            except Exception as e:
+                logger.error("Error updating search indexes: %s", e)
+
+        self.index_thread.submit(update)
+
+    async def search(
+        self, search_string: str, previous_string="", previous_matches=None
+    ):
+        return await asyncio.get_running_loop().run_in_executor(
+            self.index_thread,
+            self.find_blocks,
+            search_string,
+            previous_string,
+            previous_matches,
+        )
+
+    def find_blocks(
+        self, search_string: str, previous_string="", previous_matches=None
+    ) -> "set[str] | None":
+        """Returns the names of the blocks matching the search string, or None for all blocks
+
+        Field filters such as `type:aws_iam_role -name:legacy` are answered from the field index,
+        and any other terms of the query are matched as text within their results.
+        """
+        if not search_string:
+            return None
+        filters, terms = parse_query(search_string)
+        if filters:
+            if self.field_index is None:
+                self.field_index = FieldIndex().build(self.current_state.state_tree)
+            matches = self.field_index.query(filters, self.attribute_index)
+        # a text query that extends the previous one can only narrow its results
+        elif previous_matches is not None and search_string.lower().startswith(
+            previous_string.lower()
+        ):
+            matches = previous_matches
+        else:
+            matches = None
+        for term in terms:
+            matches = self.search_text(term, matches)
+        return matches
+
+    def search_text(self, search_string: str, within=None) -> set[str]:
+        search_index = self.search_index
+        if search_index is not None:
+            return search_index.search(search_string, within)
+        # the index is still being built in the background
+        state_tree = self.current_state.state_tree
+        search_string = search_string.lower()
+        return {
+            fullname
+            for fullname in (state_tree if within is None else within)
+            if search_string in fullname.lower()
+            or search_string in state_tree[fullname].contents.lower()
+        }
+
+    def filter_blocks(self, matches=None) -> dict:
+        state_tree = self.current_state.state_tree
+        if matches is None:
+            return state_tree
+        return {
+            fullname: block
+            for fullname, block in state_tree.items()
+            if fullname in matches
+        }
+
+    @work(exclusive=True, thread=True, group="index")
+    def build_search_index(self) -> None:
+        state_tree = self.current_state.state_tree
+        started = time.perf_counter()
+        search_index = SearchIndex().build(state_tree)
+        if (
+            get_current_worker().is_cancelled
+            or self.current_state.state_tree is not state_tree
+        ):
+            return
+        self.search_index = search_index
+        logger.debug(
+            "Search index: %s",
+            json.dumps(
+                {
+                    "blocks": search_index.blocks,
+                    "lines": len(search_index.line_ids),
+                    "trigrams": len(search_index.postings),
+                    "postings": search_index.size,
+                    "unindexed lines": len(search_index.unindexed),
+                    "seconds": round(time.perf_counter() - started, 3),
+                },
+                indent=2,
+            ),
+        )
+
+    @work(exclusive=True, group="attributes")
+    async def build_attribute_index(self) -> None:
+        """Indexes the attribute values of the json state, for `attr:path=value` filters"""
+        self.indexing_attributes = True
+        try:
+            await self.index_attributes()
+        finally:
+            self.indexing_attributes = False
+
+    async def index_attributes(self) -> None:
+        state_tree = self.current_state.state_tree
+        started = time.perf_counter()
+        resources = [
+            (fullname, block.resource)
+            for fullname, block in state_tree.items()
+            if block.resource is not None
+        ]
+        document = self.current_state_json
+        stdout = None
+        if not resources and state_tree and document is None:
+            try:
+                returncode, stdout = await execute_async(
+                    ApplicationGlobals.executable,
+                    "show",
+                    "-json",
+                    priority=Command.BACKGROUND,
+                )
+                if returncode != 0:
+                    raise Exception(stdout)
+            except CancelledError:
+                return
+            except Exception as e:
+                logger.error("Error building attribute index: %s", e)
+                return
+
+        def build() -> tuple[AttributeIndex, int]:
+            indexed = resources
+            if not indexed and state_tree:
+                # the document of a large state takes a while to parse, so it is parsed here
+                values = (document if stdout is None else json.loads(stdout)).get(
+                    "values", {}
+                )
+                indexed = [
+                    (resource["address"], resource)
+                    for _, resource in iterate_json_resources(
+                        values.get("root_module", {})
+                    )
+                ]
+            return AttributeIndex().build(indexed), len(indexed)
+
+        try:
+            attribute_index, indexed = await asyncio.to_thread(build)
+        except Exception as e:
+            logger.error("Error building attribute index: %s", e)
+            return
+        if self.current_state.state_tree is not state_tree:
+            return
+        self.attribute_index = attribute_index
+        logger.debug(
+            "Attribute index: %s",
+            json.dumps(
+                {
+                    "resources": indexed,
+                    "paths": len(attribute_index.paths),
+                    "seconds": round(time.perf_counter() - started, 3),
+                },
+                indent=2,
+            ),
         )
+        # the query that asked for the index was answered without it
+        if "attr:" in self.app.search.value:
+            self.app.perform_search(self.app.search.value.strip())
+
+    def build_tree(self, search_string="", matches=None) -> None:
+        self.clear()
+        self.selected_resources = {}
+        self.current_node = None
+        self.search_string = search_string
+        self.search_matches = matches
+
+        filtered_blocks = self.filter_blocks(matches)
         modules = {
-            block.submodule
+            block.address.module_path
             for block in filtered_blocks.values()
-            if block.submodule != ""
+            if block.address.module_path
         }
 
         logger.debug(
@@ -141,70 +628,172 @@ class StateTree(Tree):
             ),
         )
 
-        for module_fullname in sorted(modules):
-            parts = split_resource_name(module_fullname)
-            submodule = ""
-            i = 0
-            while i < len(parts):
-                parent = submodule
-                short_name = f"{parts[i]}.{parts[i+1]}"
-                submodule = (
-                    ".".join([submodule, short_name]) if submodule else short_name
-                )
-                if submodule not in module_nodes:
-                    if module_nodes.get(parent) is None:
-                        parent_node = self.root
-                    else:
-                        parent_node = module_nodes[parent]
-                    node = parent_node.add(short_name, data=submodule)
-                    module_nodes[submodule] = node
-                i += 2
-
-        # build resource tree
-        for block in filtered_blocks.values():
-            if block.submodule == "":
-                module_node = self.root
-            else:
-                module_node = module_nodes[block.submodule]
-            leaf = module_node.add_leaf(block.name, data=block)
-            if block.is_tainted:
-                leaf.label.stylize("gold3 strike")
+        self.tree_model = {"": TreeModule()}
+        for fullname, block in filtered_blocks.items():
+            self.add_to_model(fullname, block)
+        for module in self.tree_model.values():
+            module.submodules.sort()
 
-        self.root.expand_all()
+        self.root.data = ""
+        self.expand_module(self.root, TREE_EXPAND_THRESHOLD)
 
-    @work(exclusive=True)
+    # a group of its own, so that starting it doesn't cancel the refresh that starts it
+    @work(exclusive=True, group="sensitive")
     async def extract_sensitive_values(self) -> None:
         self.sensitive_values = {}
         try:
             returncode, stdout = await execute_async(
-                ApplicationGlobals.executable, "show -json"
+                ApplicationGlobals.executable,
+                "show",
+                "-json",
+                priority=Command.BACKGROUND,
             )
             if returncode == 0:
                 self.current_state_json = json.loads(stdout)
                 self.sensitive_values = extract_sensitive_values(
                     self.current_state_json
                 )
+                self.current_state.sensitive_values = self.sensitive_values
+                self.store_state_cache()
         except CancelledError:
             pass
         except Exception as e:
             logger.error("Error extracting sensitive values: %s", e)
 
+    @work(exclusive=True, thread=True, group="cache")
+    def store_state_cache(self) -> None:
+        self.current_state.store_cache()
+
+    def new_state(self) -> State:
+        return State(
+            executable=ApplicationGlobals.executable,
+            no_init=ApplicationGlobals.no_init,
+            source=ApplicationGlobals.state_source,
+            cache=StateCache() if ApplicationGlobals.use_cache else None,
+        )
+
+    def mark_stale(self, stale: bool) -> None:
+        self.stale = stale
+        if stale:
+            self.root.set_label(
+                Text.assemble("State ", ("(last known state, refreshing)", "italic"))
+            )
+        else:
+            self.root.set_label("State")
+
+    async def apply_refreshed_state(self, previous_state_tree: dict) -> None:
+        """Shows the differences between the displayed state and the one just loaded"""
+        state_tree = self.current_state.state_tree
+        # every block of the new state is compared, which is kept off the event loop
+        added, removed, changed = await asyncio.to_thread(
+            diff_state_trees, previous_state_tree, state_tree
+        )
+        if not self.search_string:
+            self.patch_tree(previous_state_tree, added, removed, changed)
+            if self.current_node is not None:
+                self.call_after_refresh(self.select_node, self.current_node)
+            return
+        self.update_indexes(state_tree, added, removed, changed)
+        self.build_tree(self.search_string, await self.search(self.search_string))
+
+    async def revalidate_snapshot(self, focus=True) -> None:
+        """Shows the last known state right away, and applies the current one once it is loaded"""
+        self.mark_stale(True)
+        self.sensitive_values = self.current_state.sensitive_values
+        self.build_tree()
+        self.field_index = FieldIndex().build(self.current_state.state_tree)
+        self.build_search_index()
+        self.current_node = self.get_node_at_line(0)
+        self.update_highlighted_resource_node(self.current_node)
+        self.loading = False
+        self.app.notify("Showing the last known state while refreshing")
+        if focus:
+            self.focus()
+
+        # the snapshot stays searchable while the current state loads into a separate object
+        fresh_state = self.new_state()
+        try:
+            async for _ in fresh_state.stream_state():
+                pass
+        except Exception as e:
+            ApplicationGlobals.successful_termination = False
+            self.app.exit(e)
+            return
+        previous_state_tree = self.current_state.state_tree
+        self.current_state = fresh_state
+        self.attribute_index = None
+        await self.apply_refreshed_state(previous_state_tree)
+        if self.search_index is None:
+            self.build_search_index()
+        self.mark_stale(False)
+        if fresh_state.source == State.SOURCE_SHOW and not fresh_state.from_cache:
+            self.extract_sensitive_values()
+        else:
+            self.sensitive_values = fresh_state.sensitive_values
+            self.store_state_cache()
+        OutboundAPIs.post_usage("refreshed state")
+
     @work(exclusive=True)
-    async def refresh_state(self, focus=True) -> None:
+    async def refresh_state(self, focus=True, changed=False) -> None:
+        if self.first_load:
+            self.first_load = False
+            if self.current_state.load_snapshot():
+                await self.revalidate_snapshot(focus)
+                return
         self.loading = True
+        self.refreshing = True
+        # the values of the previous state would be set on the new one
+        self.workers.cancel_group(self, "sensitive")
         self.app.notify("Refreshing state tree")
         self.app.search.value = ""
+        previous_state_tree = self.current_state.state_tree
+        self.attribute_index = None
+        self.current_state_json = None
+        # a tree that shows the whole state is patched in place, keeping expansion and cursor
+        incremental = bool(previous_state_tree) and not self.search_string
+        if not incremental:
+            self.clear()
+            self.selected_resources = {}
+            self.current_node = None
+            self.search_index = None
+            self.field_index = None
+            self.tree_model = {"": TreeModule()}
+            self.populated_nodes.add(self.root.id)
         try:
-            await self.current_state.refresh_state()
-            self.extract_sensitive_values()
+            # paint the tree batch by batch while terraform is still printing the state
+            async for batch in self.current_state.stream_state(changed):
+                if incremental:
+                    continue
+                self.add_streamed_blocks(batch)
+                self.loading = False
+            if (
+                self.current_state.source == State.SOURCE_SHOW
+                and not self.current_state.from_cache
+            ):
+                self.extract_sensitive_values()
+            else:
+                self.sensitive_values = self.current_state.sensitive_values
+                self.store_state_cache()
         except Exception as e:
             ApplicationGlobals.successful_termination = False
             self.app.exit(e)
             return
+        finally:
+            self.refreshing = False
 
-        self.build_tree()
-        self.current_node = self.get_node_at_line(min(self.cursor_line, self.last_line))
-        self.update_highlighted_resource_node(self.current_node)
+        self.mark_stale(False)
+        if incremental:
+            await self.apply_refreshed_state(previous_state_tree)
+        else:
+            self.build_tree()
+            self.current_node = self.get_node_at_line(
+                min(self.cursor_line, self.last_line)
+            )
+            self.update_highlighted_resource_node(self.current_node)
+        if self.field_index is None:
+            self.field_index = FieldIndex().build(self.current_state.state_tree)
+        if self.search_index is None:
+            self.build_search_index()
         self.loading = False
         OutboundAPIs.post_usage("refreshed state")
         if focus:
@@ -228,11 +817,7 @@ class StateTree(Tree):
         if not self.current_node.allow_expand:
             self.app.resource.clear()
             self.app.resource.write(self.current_node.data.contents)
-            self.app.switcher.border_title = (
-                f"{self.current_node.data.submodule}.{self.current_node.data.name}"
-                if self.current_node.data.submodule
-                else self.current_node.data.name
-            )
+            self.app.switcher.border_title = str(self.current_node.data.address)
             self.app.switcher.current = "resource"
 
     def select_current_node(self) -> None:
@@ -243,14 +828,35 @@ class StateTree(Tree):
             or self.current_node.data.type == Block.TYPE_DATASOURCE
         ):
             return
-        if self.current_node in self.selected_nodes:
-            self.selected_nodes.remove(self.current_node)
-            self.current_node.label = self.current_node.label.plain
-            if self.current_node.data.is_tainted:
-                self.current_node.label.stylize("gold3 strike")
+        fullname = str(self.current_node.data.address)
+        if fullname in self.selected_resources:
+            del self.selected_resources[fullname]
         else:
-            self.selected_nodes.append(self.current_node)
-            self.current_node.label.stylize("red bold italic reverse")
+            self.selected_resources[fullname] = None
+        self.style_block_node(self.current_node, fullname)
+
+    def select_all_nodes(self) -> None:
+        """Selects every resource in the tree, e.g. the results of a query, or clears the selection"""
+        fullnames = [
+            fullname
+            for module in self.tree_model.values()
+            for fullname, block in module.blocks.items()
+            if block.type == Block.TYPE_RESOURCE
+        ]
+        if all(fullname in self.selected_resources for fullname in fullnames):
+            self.selected_resources = {}
+        else:
+            self.selected_resources = dict.fromkeys(fullnames)
+        # nodes that aren't created yet are styled when they are
+        for fullname, node in self.resource_nodes.items():
+            self.style_block_node(node, fullname)
+        self.app.notify(f"{len(self.selected_resources)} resources selected")
+
+    def target_addresses(self) -> list[str]:
+        """The selected resources, or the highlighted one when none is selected"""
+        if self.selected_resources:
+            return list(self.selected_resources)
+        return [str(node.data.address) for node in self.highlighted_resource_node]
 
     def display_sensitive_data(self, fullname, contents) -> None:
         self.app.resource.clear()
@@ -265,11 +871,14 @@ class StateTree(Tree):
 
 
 class TerraformTUI(App):
+    header = None
     switcher = None
     tree = None
     resource = None
     search = None
     plan = None
+    plantree = None
+    planstatus = None
     selected_action = None
     error_message = ""
 
@@ -278,7 +887,7 @@ class TerraformTUI(App):
         self.dark = ApplicationGlobals.darkmode
 
     TITLE = f"Terraform TUI v{OutboundAPIs.version}"
-    SUB_TITLE = f"The textual UI for Terraform{' (new version available)' if OutboundAPIs.is_new_version_available else ''}"
+    SUB_TITLE = "The textual UI for Terraform"
     CSS_PATH = "ui.tcss"
 
     BINDINGS = [
@@ -289,6 +898,7 @@ class TerraformTUI(App):
         Binding("k", "up", "Up", show=False),
         Binding("l", "right", "Right", show=False),
         Binding("spacebar", "select", "Select"),
+        Binding("ctrl+a", "select_all", "Select all", show=False),
         ("f", "fullscreen", "FullScreen"),
         ("d", "delete", "Delete"),
         ("t", "taint", "Taint"),
@@ -297,6 +907,7 @@ class TerraformTUI(App):
         ("r", "refresh", "Refresh"),
         ("p", "plan", "Plan"),
         ("a", "apply", "Apply"),
+        Binding("v", "plan_view", "Plan view", show=False),
         ("ctrl+d", "destroy", "Destroy"),
         ("/", "search", "Search"),
         ("0-9", "collapse", "Collapse"),
@@ -320,34 +931,97 @@ class TerraformTUI(App):
                 classes="resource",
                 auto_scroll=False,
             )
-            yield PlanScreen(id="plan", executable=ApplicationGlobals.executable)
+            yield PlanScreen(
+                id="plan",
+                executable=ApplicationGlobals.executable,
+                json_events=ApplicationGlobals.json_events,
+                cache=PlanCache() if ApplicationGlobals.use_cache else None,
+            )
+            yield PlanTree("Plan", id="plantree")
+            yield PlanStatus(id="planstatus")
         yield Footer()
 
     def on_mount(self) -> None:
+        # kept, as queries only search the active screen, which may be a modal
+        self.header = self.get_widget_by_id("header")
         self.resource = self.get_widget_by_id("resource")
         self.tree = self.get_widget_by_id("tree")
         self.switcher = self.get_widget_by_id("switcher")
         self.search = self.get_widget_by_id("search")
         self.plan = self.get_widget_by_id("plan")
+        self.plantree = self.get_widget_by_id("plantree")
+        self.planstatus = self.get_widget_by_id("planstatus")
+        self.watch(self.switcher, "current", self.switch_search, init=False)
+        if ApplicationGlobals.check_version:
+            self.check_for_new_version()
 
     def on_ready(self) -> None:
+        if ApplicationGlobals.started is not None:
+            logger.debug(
+                "Time to first frame: %s",
+                json.dumps(
+                    {
+                        "seconds": round(
+                            time.perf_counter() - ApplicationGlobals.started, 3
+                        )
+                    },
+                    indent=2,
+                ),
+            )
         self.tree.refresh_state()
+        self.report_start()
+
+    @work(thread=True, group="usage")
+    def report_start(self) -> None:
+        # the usage client is imported with the first event, after the first frame
+        OutboundAPIs.post_usage("started application", platform=platform.platform())
+
+    @work(thread=True, group="version")
+    def check_for_new_version(self) -> None:
+        OutboundAPIs.check_for_new_version()
+        if OutboundAPIs.is_new_version_available:
+            self.call_from_thread(self.show_new_version)
+
+    def show_new_version(self) -> None:
+        self.sub_title = f"{self.SUB_TITLE} (new version available)"
+        self.header.update_info()
+
+    def switch_search(self, previous: str, current: str) -> None:
+        """Shows the plan tree's filter in the search box on the plan tree, the state tree's elsewhere"""
+        if (previous == "plantree") != (current == "plantree"):
+            self.search.value = (
+                self.plantree.pattern
+                if current == "plantree"
+                else self.tree.search_string
+            )
 
     def on_input_changed(self, event: Input.Changed) -> None:
-        if self.app.search.value == "":
+        if self.switcher.current == "plantree":
+            self.plantree.filter(event.value.strip())
             return
-        elif self.app.tree.loading:
+        if self.app.search.value == "" and not self.app.tree.search_string:
+            return
+        elif self.app.tree.loading or self.app.tree.refreshing:
+            # the refresh clears the search box itself, and rebuilds the tree unfiltered
+            if event.value == "":
+                return
             self.app.search.value = ""
             self.app.notify(
                 "Please wait until state refresh is complete", severity="warning"
             )
         elif event.input.id == "search":
             search_string = event.value.strip()
+            if search_string == self.tree.search_string:
+                # e.g. the state tree's filter put back, which mustn't rebuild the tree
+                self.workers.cancel_group(self, "search")
+                return
             self.perform_search(search_string)
 
     def on_input_submitted(self, event: Input.Submitted) -> None:
         if self.switcher.current == "tree":
             self.tree.focus()
+        elif self.switcher.current == "plantree":
+            self.plantree.focus()
 
     def on_key(self, event) -> None:
         if event.key == "j":
@@ -388,22 +1062,47 @@ class TerraformTUI(App):
                         self.tree.scroll_to_node(self.tree.current_node)
 
     async def manipulate_resources(self, what_to_do: str) -> None:
-        nodes = (
-            self.tree.selected_nodes
-            if self.tree.selected_nodes
-            else self.tree.highlighted_resource_node
+        addresses = self.tree.target_addresses()
+
+        reported = 0
+
+        def progress(done, total):
+            # at most ten notifications, however many commands are run
+            nonlocal reported
+            if total > 1 and (done - reported >= total / 10 or done == total):
+                reported = done
+                self.notify(f"{what_to_do.capitalize()}: {done}/{total} resources")
+
+        failures = await run_operations(
+            ApplicationGlobals.executable,
+            what_to_do,
+            addresses,
+            progress,
         )
-        for node in nodes:
-            await execute_async(
-                ApplicationGlobals.executable,
-                (what_to_do if what_to_do != "delete" else "state rm"),
-                (
-                    ".".join([node.data.submodule, node.data.name])
-                    if node.data.submodule
-                    else node.data.name
+        if failures:
+            self.notify(
+                "\n".join(
+                    f"{address}: {error_summary(error)}"
+                    for address, error in failures.items()
                 ),
+                title=f"Failed to {what_to_do} {len(failures)} of {len(addresses)} resources",
+                severity="error",
+                timeout=30,
             )
 
+    async def perform_surgery(self, surgery: StateSurgery) -> None:
+        self.switcher.loading = True
+        self.notify(f"Pushing the state with {len(surgery.operations)} changes")
+        try:
+            backup = await surgery.push()
+            self.notify(f"State pushed, previous state saved to {backup}")
+            OutboundAPIs.post_usage(f"applied batch {self.selected_action}")
+        except Exception as e:
+            self.notify(str(e), title="Error pushing state", severity="error")
+        self.tree.refresh_state(changed=True)
+        self.tree.focus()
+        self.switcher.loading = False
+
     async def perform_action(self) -> None:
         if self.selected_action in ["taint", "untaint", "delete"]:
             self.switcher.loading = True
@@ -412,19 +1111,31 @@ class TerraformTUI(App):
             )
             await self.manipulate_resources(self.selected_action)
             OutboundAPIs.post_usage(f"applied {self.selected_action}")
-            self.tree.refresh_state()
+            self.tree.refresh_state(changed=True)
             self.tree.focus()
             self.switcher.loading = False
 
-    def perform_search(self, search_string: str) -> None:
+    @work(exclusive=True, group="search")
+    async def perform_search(self, search_string: str) -> None:
+        # every keystroke restarts the wait, so only the last query of a burst is searched
+        await asyncio.sleep(SEARCH_DEBOUNCE)
+        if (
+            self.tree.attribute_index is None
+            and not self.tree.indexing_attributes
+            and any(field == "attr" for _, field, _ in parse_query(search_string)[0])
+        ):
+            self.notify("Indexing resource attributes, results will follow")
+            self.tree.build_attribute_index()
+        matches = await self.tree.search(
+            search_string, self.tree.search_string, self.tree.search_matches
+        )
         self.tree.root.collapse_all()
-        self.tree.build_tree(search_string)
+        self.tree.build_tree(search_string, matches)
         self.tree.root.expand()
 
     def action_back(self) -> None:
         if (
-            not self.switcher.current == "resource"
-            and not self.switcher.current == "plan"
+            self.switcher.current not in ("resource", *PLAN_VIEWS)
             and not self.focused.id == "search"
         ):
             return
@@ -440,17 +1151,8 @@ class TerraformTUI(App):
                 self.notify(f"Creating {destroy} plan")
                 targets = []
                 if response[1]:
-                    if self.tree.selected_nodes:
-                        targets = [
-                            f"{node.parent.data}.{node.label.plain}".lstrip(".")
-                            for node in self.tree.selected_nodes
-                        ]
-                    else:
-                        targets = [
-                            f"{node.parent.data}.{node.label.plain}".lstrip(".")
-                            for node in self.tree.highlighted_resource_node
-                        ]
-                self.plan.create_plan(response[0], targets, destroy)
+                    targets = self.tree.target_addresses()
+                self.plan.create_plan(response[0], targets, destroy, response[2])
                 OutboundAPIs.post_usage(
                     f"create {'targeted' if targets else ''} {destroy} plan"
                 )
@@ -460,7 +1162,7 @@ class TerraformTUI(App):
         self.push_screen(
             PlanInputsModal(
                 ApplicationGlobals.var_file,
-                len(self.tree.selected_nodes) > 0,
+                len(self.tree.selected_resources) > 0,
             ),
             execute,
         )
@@ -493,25 +1195,45 @@ class TerraformTUI(App):
         self.push_screen(YesNoModal(question), execute_if_yes)
         self.plan.focus()
 
+    def action_plan_view(self) -> None:
+        """Cycles between the plan output, the tree of its changes and the status of its resources"""
+        if self.switcher.current not in PLAN_VIEWS:
+            return
+        views = [
+            view
+            for view in PLAN_VIEWS
+            if view == self.switcher.current
+            or (view == "plan")
+            or (view == "plantree" and self.plantree.changes is not None)
+            or (view == "planstatus" and self.planstatus.stream.resources)
+        ]
+        if len(views) == 1:
+            self.notify("The plan's changes are not loaded yet", severity="warning")
+            return
+        view = views[(views.index(self.switcher.current) + 1) % len(views)]
+        self.switcher.current = view
+        self.get_widget_by_id(view).focus()
+
     def action_select(self) -> None:
         if not self.switcher.current == "tree":
             return
         self.tree.select_current_node()
 
+    def action_select_all(self) -> None:
+        if not self.switcher.current == "tree":
+            return
+        self.tree.select_all_nodes()
+
     async def action_manipulate_resources(self, what_to_do: str) -> None:
         if not self.switcher.current == "tree":
             return
-        nodes = (
-            self.tree.selected_nodes
-            if self.tree.selected_nodes
-            else self.tree.highlighted_resource_node
-        )
+        resources = self.tree.target_addresses()
 
-        if nodes:
+        if resources:
             self.selected_action = what_to_do
-            resources = [
-                f"{node.parent.data}.{node.label.plain}".lstrip(".") for node in nodes
-            ]
+            if ApplicationGlobals.batch_state:
+                await self.confirm_surgery(what_to_do, resources)
+                return
 
             question = Text.assemble(
                 ("Are you sure you wish to ", "bold"),
@@ -526,6 +1248,37 @@ class TerraformTUI(App):
 
             self.push_screen(YesNoModal(question), execute_if_yes)
 
+    async def confirm_surgery(self, what_to_do: str, resources: list) -> None:
+        """Pulls the state once and shows what a single push of all the changes would do"""
+        self.switcher.loading = True
+        surgery = StateSurgery(ApplicationGlobals.executable)
+        try:
+            await surgery.pull()
+            for resource in resources:
+                surgery.add(
+                    StateSurgery.RM if what_to_do == "delete" else what_to_do, resource
+                )
+            changes = surgery.dry_run()
+        except Exception as e:
+            self.notify(str(e), title="Error preparing state changes", severity="error")
+            return
+        finally:
+            self.switcher.loading = False
+
+        question = Text.assemble(
+            ("Are you sure you wish to ", "bold"),
+            (what_to_do, "bold red"),
+            (" the selected resources in a single state push?\n\n - ", "bold"),
+            ("\n - ".join(changes[:-1])),
+            (f"\n\n{changes[-1]}", "bold"),
+        )
+
+        async def execute_if_yes(flag):
+            if flag:
+                await self.perform_surgery(surgery)
+
+        self.push_screen(YesNoModal(question), execute_if_yes)
+
     async def action_delete(self) -> None:
         await self.action_manipulate_resources("delete")
 
@@ -536,6 +1289,8 @@ class TerraformTUI(App):
         await self.action_manipulate_resources("untaint")
 
     def action_copy(self) -> None:
+        import pyperclip
+
         try:
             if self.switcher.current == "resource":
                 pyperclip.copy(self.app.tree.current_node.data.contents)
@@ -559,11 +1314,12 @@ class TerraformTUI(App):
         self.dark = not self.dark
 
     def expand_node(self, level, node) -> None:
-        if not node.allow_expand:
+        if not isinstance(node.data, str):
             return
-        cnt = node.data.count(".module.") + 1
+        cnt = len(parse_module_path(node.data))
         if level <= cnt:
             return
+        self.tree.populate(node)
         for child in node.children:
             self.expand_node(level, child)
         node.expand()
@@ -572,7 +1328,7 @@ class TerraformTUI(App):
         if not self.switcher.current == "tree":
             return
         if level == 0:
-            self.tree.root.expand_all()
+            self.tree.expand_module(self.tree.root)
         else:
             self.tree.root.collapse_all()
             for node in self.tree.root.children:
@@ -580,51 +1336,61 @@ class TerraformTUI(App):
             self.tree.root.expand()
 
     def action_search(self) -> None:
+        if self.switcher.current == "plantree":
+            self.search.focus()
+            return
         self.switcher.border_title = ""
         self.switcher.current = "tree"
         self.search.focus()
 
-    def action_workspaces(self) -> None:
+    async def action_workspaces(self) -> None:
         if self.switcher.current != "tree":
             return
 
-        result = subprocess.run(
-            [ApplicationGlobals.executable, "workspace", "list"],
-            capture_output=True,
-            text=True,
-        )
+        try:
+            returncode, stdout = await execute_async(
+                ApplicationGlobals.executable,
+                "workspace",
+                "list",
+                timeout=WORKSPACE_COMMAND_TIMEOUT,
+                priority=Command.INTERACTIVE,
+            )
+        except TimeoutError as e:
+            returncode, stdout = (None, str(e))
 
-        if result.returncode == 0:
+        if returncode == 0:
             workspaces = []
-            for workspace in result.stdout.split("\n"):
+            for workspace in stdout.split("\n"):
                 if workspace.strip():
                     workspaces.append(workspace[2:])
                 if workspace.startswith("*"):
                     current_workspace = workspace[2:]
         else:
-            logger.error(f"Error getting workspaces: {result.stderr}")
+            logger.error(f"Error getting workspaces: {stdout}")
             self.notify("Failed getting workspaces", severity="error")
+            return
 
-        def switch_workspace(selected_workspace: str):
+        async def switch_workspace(selected_workspace: str):
             if (
                 selected_workspace is not None
                 and selected_workspace != current_workspace
             ):
-                result = subprocess.run(
-                    [
+                try:
+                    returncode, stdout = await execute_async(
                         ApplicationGlobals.executable,
                         "workspace",
                         "select",
                         selected_workspace,
-                    ],
-                    capture_output=True,
-                    text=True,
-                )
-                if result.returncode == 0:
-                    self.app.get_child_by_id("header").refresh_info()
+                        timeout=WORKSPACE_COMMAND_TIMEOUT,
+                        priority=Command.INTERACTIVE,
+                    )
+                except TimeoutError as e:
+                    returncode, stdout = (None, str(e))
+                if returncode == 0:
+                    self.header.refresh_info()
                     self.action_refresh()
                 else:
-                    logger.error(f"Failed switching workspaces: {result.stderr}")
+                    logger.error(f"Failed switching workspaces: {stdout}")
                     self.notify("Failed switching workspaces", severity="error")
 
         self.push_screen(
@@ -632,7 +1398,7 @@ class TerraformTUI(App):
         )
 
     def action_fullscreen(self) -> None:
-        if self.switcher.current not in ("plan", "resource"):
+        if self.switcher.current not in ("resource", *PLAN_VIEWS):
             return
         self.push_screen(
             FullTextModal(
@@ -649,9 +1415,7 @@ class TerraformTUI(App):
     def action_sensitive(self) -> None:
         if self.switcher.current != "resource":
             return
-        fullname = f"{self.tree.current_node.data.submodule}.{self.tree.current_node.data.name}".strip(
-            "."
-        )
+        fullname = str(self.tree.current_node.data.address)
         if self.tree.current_node.data.contents is None:
             self.notify("Unable to display sensitive contents", severity="warning")
         else:
@@ -674,70 +1438,21 @@ class TerraformTUI(App):
         super()._on_resize(event)
 
 
-def parse_command_line() -> None:
-    parser = argparse.ArgumentParser(
-        prog="tftui",
-        description="TFTUI - the Terraform terminal UI",
-        epilog="Enjoy!",
-    )
-    parser.add_argument(
-        "-e",
-        "--executable",
-        help="set executable command (default 'terraform')",
-    )
-    parser.add_argument(
-        "-n",
-        "--no-init",
-        help="do not run terraform init on startup (default run)",
-        action="store_true",
-    )
-    parser.add_argument(
-        "-f",
-        "--var-file",
-        help="tfvars filename to be used in planning",
-    )
-    parser.add_argument(
-        "-o",
-        "--offline",
-        help="run in offline mode (i.e. no outbound API calls; default online)",
-        action="store_true",
-    )
-    parser.add_argument(
-        "-d",
-        "--disable-usage-tracking",
-        help="disable usage tracking (default enabled)",
-        action="store_true",
-    )
-    parser.add_argument(
-        "-l",
-        "--light-mode",
-        help="enable light mode (default dark)",
-        action="store_true",
-    )
-    parser.add_argument(
-        "-g",
-        "--generate-debug-log",
-        action="store_true",
-        help="generate debug log file (default disabled)",
-    )
-    parser.add_argument(
-        "-v", "--version", help="show version information", action="store_true"
-    )
-    args = parser.parse_args()
-
-    if args.offline or args.disable_usage_tracking:
-        OutboundAPIs.disable_usage_tracking()
-    if not args.offline:
-        OutboundAPIs.check_for_new_version()
-    if args.version:
-        print(
-            f"\ntftui v{OutboundAPIs.version}{' (new version available)' if OutboundAPIs.is_new_version_available else ''}\n"
-        )
-        exit(0)
+def apply_command_line(args: argparse.Namespace) -> None:
+    if args.offline:
+        ApplicationGlobals.check_version = False
     if args.executable:
         ApplicationGlobals.executable = args.executable
     if args.var_file:
         ApplicationGlobals.var_file = args.var_file
+    if args.state_source:
+        ApplicationGlobals.state_source = args.state_source
+    if args.no_cache:
+        ApplicationGlobals.use_cache = False
+    if args.batch_state:
+        ApplicationGlobals.batch_state = True
+    if args.json_events:
+        ApplicationGlobals.json_events = True
     if args.generate_debug_log:
         logger = setup_logging("debug")
         logger.debug("*" * 50)
@@ -753,9 +1468,9 @@ def parse_command_line() -> None:
         exit(1)
 
 
-def main() -> None:
-    parse_command_line()
-    OutboundAPIs.post_usage("started application", platform=platform.platform())
+def main(args: argparse.Namespace = None) -> None:
+    ApplicationGlobals.started = time.perf_counter()
+    apply_command_line(args or parse_command_line())
 
     result = ""
     try:
@@ -2,8 +2,19 @@ import platform
 import socket
 import hashlib
 import importlib.metadata
-import requests
-from tftui.constants import nouns, adjectives
+import json
+import os
+import time
+
+VERSION_CHECK_TIMEOUT = 2
+VERSION_CACHE_TTL = 24 * 60 * 60
+
+
+def version_cache_path() -> str:
+    cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.join(
+        os.path.expanduser("~"), ".cache"
+    )
+    return os.path.join(cache_home, "tftui", "latest-version.json")
 
 
 class OutboundAPIs:
@@ -15,17 +26,47 @@ class OutboundAPIs:
 
     @staticmethod
     def check_for_new_version():
+        """Compares with the latest version on PyPI, asked at most once a day"""
+        ver = OutboundAPIs.cached_latest_version()
+        if ver is None:
+            try:
+                import requests
+
+                response = requests.get(
+                    "https://pypi.org/pypi/tftui/json", timeout=VERSION_CHECK_TIMEOUT
+                )
+                if response.status_code == 200:
+                    ver = response.json()["info"]["version"]
+                    OutboundAPIs.cache_latest_version(ver)
+            except Exception:
+                pass
+        if ver is not None and ver != OutboundAPIs.version:
+            OutboundAPIs.is_new_version_available = True
+
+    @staticmethod
+    def cached_latest_version() -> "str | None":
         try:
-            response = requests.get("https://pypi.org/pypi/tftui/json")
-            if response.status_code == 200:
-                ver = response.json()["info"]["version"]
-                if ver != OutboundAPIs.version:
-                    OutboundAPIs.is_new_version_available = True
-        except Exception:
+            with open(version_cache_path()) as file:
+                cached = json.load(file)
+            if time.time() - cached["checked"] < VERSION_CACHE_TTL:
+                return cached["version"]
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+        return None
+
+    @staticmethod
+    def cache_latest_version(ver: str) -> None:
+        try:
+            os.makedirs(os.path.dirname(version_cache_path()), exist_ok=True)
+            with open(version_cache_path(), "w") as file:
+                json.dump({"version": ver, "checked": time.time()}, file)
+        except OSError:
             pass
 
     @staticmethod
     def generate_handle():
+        from tftui.constants import nouns, adjectives
+
         fingerprint_data = f"{platform.system()}-{platform.node()}-{platform.release()}-{socket.gethostname()}"
         fingerprint = int(hashlib.sha256(fingerprint_data.encode()).hexdigest(), 16)
         OutboundAPIs.generated_handle = (
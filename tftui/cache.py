@@ -0,0 +1,253 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+import zlib
+from tftui.debug_log import setup_logging
+
+logger = setup_logging()
+
+CACHE_VERSION = 2
+CACHE_MAX_SIZE = 128 * 1024 * 1024
+STATE_HEADER_SIZE = 64 * 1024
+PLAN_CACHE_ENTRIES = 8
+# the files a plan depends on, besides the state and the var-file passed on the command line
+CONFIGURATION_SUFFIXES = (
+    ".tf",
+    ".tf.json",
+    ".tfvars",
+    ".tfvars.json",
+    ".terraform.lock.hcl",
+)
+
+
+def data_dir() -> str:
+    return os.environ.get("TF_DATA_DIR", ".terraform")
+
+
+def current_workspace() -> str:
+    if os.environ.get("TF_WORKSPACE"):
+        return os.environ["TF_WORKSPACE"]
+    try:
+        with open(os.path.join(data_dir(), "environment")) as file:
+            return file.read().strip() or "default"
+    except OSError:
+        return "default"
+
+
+def local_state_path(workspace: str) -> "str | None":
+    """Returns the state file of a local backend, or None when the state is stored remotely"""
+    try:
+        with open(os.path.join(data_dir(), "terraform.tfstate")) as file:
+            backend = json.load(file).get("backend") or {}
+    except (OSError, ValueError):
+        backend = {"type": "local"}
+    if backend.get("type") != "local":
+        return None
+    config = backend.get("config") or {}
+    if workspace == "default":
+        return config.get("path") or "terraform.tfstate"
+    return os.path.join(
+        config.get("workspace_dir") or "terraform.tfstate.d",
+        workspace,
+        "terraform.tfstate",
+    )
+
+
+def read_state_header(path: str) -> tuple:
+    """Reads the lineage and serial from the top of a state file without parsing all of it"""
+    with open(path) as file:
+        header = file.read(STATE_HEADER_SIZE)
+    serial = re.search(r'"serial":\s*(\d+)', header)
+    lineage = re.search(r'"lineage":\s*"([^"]+)"', header)
+    if serial is None or lineage is None:
+        return (None, None)
+    return (lineage.group(1), int(serial.group(1)))
+
+
+class StateCache:
+    """Parsed states stored under the terraform data dir, one file per workspace"""
+
+    directory = None
+    max_size = CACHE_MAX_SIZE
+
+    def __init__(self, directory=None, max_size=CACHE_MAX_SIZE):
+        self.directory = directory or os.path.join(data_dir(), "tftui")
+        self.max_size = max_size
+
+    def workspace_prefix(self, workspace: str) -> str:
+        return f"state-{hashlib.sha256(workspace.encode()).hexdigest()[:12]}-"
+
+    def filename(self, workspace: str, lineage: str, serial: int) -> str:
+        key = hashlib.sha256(f"{lineage}:{serial}".encode()).hexdigest()[:12]
+        return os.path.join(
+            self.directory, f"{self.workspace_prefix(workspace)}{key}.cache"
+        )
+
+    def load(
+        self, workspace: str, lineage: str, serial: int, source: str
+    ) -> "dict | None":
+        path = self.filename(workspace, lineage, serial)
+        try:
+            with open(path, "rb") as file:
+                entry = json.loads(zlib.decompress(file.read()))
+        except (OSError, ValueError, zlib.error):
+            return None
+        if (
+            entry.get("version") != CACHE_VERSION
+            or entry.get("lineage") != lineage
+            or entry.get("serial") != serial
+            or entry.get("source") != source
+        ):
+            return None
+        os.utime(path)
+        return entry
+
+    def load_latest(self, workspace: str, source: str) -> "dict | None":
+        """Returns the last stored state of a workspace, whatever its serial, for a stale first paint"""
+        prefix = self.workspace_prefix(workspace)
+        try:
+            paths = [
+                os.path.join(self.directory, name)
+                for name in os.listdir(self.directory)
+                if name.startswith(prefix) and name.endswith(".cache")
+            ]
+            if not paths:
+                return None
+            with open(max(paths, key=os.path.getmtime), "rb") as file:
+                entry = json.loads(zlib.decompress(file.read()))
+        except (OSError, ValueError, zlib.error):
+            return None
+        if entry.get("version") != CACHE_VERSION or entry.get("source") != source:
+            return None
+        return entry
+
+    def store(
+        self, workspace: str, lineage: str, serial: int, source: str, entry: dict
+    ) -> None:
+        # each source renders the blocks differently, so an entry only serves its own source
+        entry = dict(
+            entry, version=CACHE_VERSION, lineage=lineage, serial=serial, source=source
+        )
+        path = self.filename(workspace, lineage, serial)
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            # an older serial of the same workspace will never be read again
+            prefix = self.workspace_prefix(workspace)
+            for name in os.listdir(self.directory):
+                if name.startswith(prefix) and name.endswith(".cache"):
+                    os.remove(os.path.join(self.directory, name))
+            with open(f"{path}.tmp", "wb") as file:
+                file.write(zlib.compress(json.dumps(entry).encode(), 1))
+            os.replace(f"{path}.tmp", path)
+            self.evict()
+        except OSError as e:
+            logger.error("Error storing state cache: %s", e)
+
+    def evict(self) -> None:
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.startswith("state-") and name.endswith(".cache"):
+                stat = os.stat(os.path.join(self.directory, name))
+                entries.append((stat.st_mtime, stat.st_size, name))
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total_size <= self.max_size:
+                break
+            os.remove(os.path.join(self.directory, name))
+            total_size -= size
+
+
+def configuration_digest(root=".") -> str:
+    """Hashes the configuration files of the root and of the modules below it"""
+    digest = hashlib.sha256()
+    for directory, directories, files in os.walk(root):
+        # skips the data dir (with its downloaded modules), .git and the like
+        directories[:] = sorted(
+            name for name in directories if not name.startswith(".")
+        )
+        for name in sorted(files):
+            if name.endswith(CONFIGURATION_SUFFIXES):
+                path = os.path.join(directory, name)
+                digest.update(os.path.relpath(path, root).encode() + b"\0")
+                with open(path, "rb") as file:
+                    digest.update(hashlib.sha256(file.read()).digest())
+    return digest.hexdigest()
+
+
+def plan_fingerprint(inputs: dict, var_file: "str | None" = None) -> str:
+    """Hashes everything a plan depends on that tftui can see without running terraform"""
+    digest = hashlib.sha256(json.dumps(inputs, sort_keys=True).encode())
+    digest.update(configuration_digest().encode())
+    if var_file:
+        try:
+            with open(var_file, "rb") as file:
+                digest.update(hashlib.sha256(file.read()).digest())
+        except OSError:
+            pass
+    # variables may also come from the environment
+    for name in sorted(os.environ):
+        if name.startswith("TF_VAR_"):
+            digest.update(f"{name}={os.environ[name]}\0".encode())
+    return digest.hexdigest()
+
+
+class PlanCache:
+    """Saved plans and their output stored under the terraform data dir, keyed by fingerprint"""
+
+    directory = None
+    max_entries = PLAN_CACHE_ENTRIES
+
+    def __init__(self, directory=None, max_entries=PLAN_CACHE_ENTRIES):
+        self.directory = directory or os.path.join(data_dir(), "tftui")
+        self.max_entries = max_entries
+
+    def filename(self, fingerprint: str) -> str:
+        return os.path.join(self.directory, f"plan-{fingerprint[:24]}")
+
+    def load(self, fingerprint: str, planfile: str) -> "dict | None":
+        """Returns the output of the plan with the fingerprint, after restoring its plan file"""
+        path = self.filename(fingerprint)
+        try:
+            with open(f"{path}.cache", "rb") as file:
+                entry = json.loads(zlib.decompress(file.read()))
+            if (
+                entry.get("version") != CACHE_VERSION
+                or entry.get("fingerprint") != fingerprint
+            ):
+                return None
+            shutil.copyfile(f"{path}.plan", planfile)
+        except (OSError, ValueError, zlib.error):
+            return None
+        os.utime(f"{path}.cache")
+        return entry
+
+    def store(self, fingerprint: str, planfile: str, entry: dict) -> None:
+        entry = dict(entry, version=CACHE_VERSION, fingerprint=fingerprint)
+        path = self.filename(fingerprint)
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            shutil.copyfile(planfile, f"{path}.plan")
+            with open(f"{path}.tmp", "wb") as file:
+                file.write(zlib.compress(json.dumps(entry).encode(), 1))
+            os.replace(f"{path}.tmp", f"{path}.cache")
+            self.evict()
+        except OSError as e:
+            logger.error("Error storing plan cache: %s", e)
+
+    def evict(self) -> None:
+        entries = sorted(
+            (
+                os.path.getmtime(os.path.join(self.directory, name)),
+                name[: -len(".cache")],
+            )
+            for name in os.listdir(self.directory)
+            if name.startswith("plan-") and name.endswith(".cache")
+        )
+        for _, name in entries[: -self.max_entries]:
+            for suffix in (".cache", ".plan"):
+                try:
+                    os.remove(os.path.join(self.directory, name + suffix))
+                except OSError:
+                    pass
@@ -0,0 +1,161 @@
+import asyncio
+import json
+from fnmatch import fnmatchcase
+from rich.text import Text
+from tftui.commands import Command, execute_async
+from tftui.debug_log import setup_logging
+
+logger = setup_logging()
+
+PLAN_FILE = "tftui.plan"
+# terraform's action list of a change: (symbol, color, description)
+ACTIONS = {
+    ("create",): ("+", "green3", "will be created"),
+    ("delete",): ("-", "red", "will be destroyed"),
+    ("update",): ("~", "yellow3", "will be updated in-place"),
+    ("delete", "create"): ("-/+", "red", "must be replaced"),
+    ("create", "delete"): ("+/-", "red", "must be replaced"),
+    ("read",): ("<=", "cyan", "will be read during apply"),
+}
+DIFF_COLORS = {"+": "green3", "-": "red", "~": "yellow3"}
+UNKNOWN_VALUE = "(known after apply)"
+SENSITIVE_VALUE = "(sensitive value)"
+
+
+def is_sensitive(sensitive) -> bool:
+    if isinstance(sensitive, dict):
+        return any(is_sensitive(value) for value in sensitive.values())
+    if isinstance(sensitive, list):
+        return any(is_sensitive(value) for value in sensitive)
+    return sensitive is True
+
+
+def child(structure, key):
+    """The part of a before/after/unknown/sensitive structure that describes an attribute"""
+    return structure.get(key) if isinstance(structure, dict) else None
+
+
+def diff_attributes(before, after, unknown, sensitive, depth=1) -> list[Text]:
+    """Renders the changed attributes of an object, like terraform's plan output does
+
+    `sensitive` is the pair of before and after sensitivity structures.
+    """
+    before = before if isinstance(before, dict) else {}
+    after = after if isinstance(after, dict) else {}
+    padding = "    " * depth
+    lines = []
+    for key in dict.fromkeys(
+        [*before, *after, *(unknown if isinstance(unknown, dict) else {})]
+    ):
+        old = before.get(key)
+        new = after.get(key)
+        key_unknown = child(unknown, key)
+        key_sensitive = tuple(child(structure, key) for structure in sensitive)
+        masked = any(is_sensitive(structure) for structure in key_sensitive)
+        if (isinstance(old, dict) or isinstance(new, dict)) and not (
+            masked or key_unknown is True
+        ):
+            nested = diff_attributes(old, new, key_unknown, key_sensitive, depth + 1)
+            if nested:
+                symbol = "+" if old is None else "-" if new is None else "~"
+                lines.append(Text(f"{padding}{symbol} {key} {{", DIFF_COLORS[symbol]))
+                lines.extend(nested)
+                lines.append(Text(f"{padding}  }}", DIFF_COLORS[symbol]))
+            continue
+        if key_unknown is not True and old == new:
+            continue
+        old_text = SENSITIVE_VALUE if masked else json.dumps(old)
+        new_text = (
+            UNKNOWN_VALUE
+            if key_unknown is True
+            else SENSITIVE_VALUE
+            if masked
+            else json.dumps(new)
+        )
+        if old is None:
+            lines.append(Text(f"{padding}+ {key} = {new_text}", "green3"))
+        elif new is None and key_unknown is not True:
+            lines.append(Text(f"{padding}- {key} = {old_text} -> null", "red"))
+        else:
+            lines.append(
+                Text.assemble(
+                    (f"{padding}~ {key} = ", "yellow3"),
+                    (old_text, "red"),
+                    (" -> ", "yellow3"),
+                    (new_text, "green3"),
+                )
+            )
+    return lines
+
+
+class ResourceChange:
+    """The planned change of a single resource instance, taken from `resource_changes`"""
+
+    def __init__(self, change: dict):
+        self.address = change["address"]
+        self.module = change.get("module_address", "")
+        details = change.get("change", {})
+        self.action = tuple(details.get("actions", ["no-op"]))
+        self.before = details.get("before")
+        self.after = details.get("after")
+        self.after_unknown = details.get("after_unknown") or {}
+        self.sensitive = (
+            details.get("before_sensitive") or {},
+            details.get("after_sensitive") or {},
+        )
+
+    @property
+    def label(self) -> Text:
+        symbol, color, description = ACTIONS.get(
+            self.action, ("?", "", " ".join(self.action))
+        )
+        return Text.assemble(
+            (f"{symbol} ", f"bold {color}"),
+            (self.address, color),
+            (f" {description}", "dim"),
+        )
+
+    def diff(self) -> list[Text]:
+        """Renders the attributes that change, only called when the resource is expanded"""
+        return diff_attributes(
+            self.before, self.after, self.after_unknown, self.sensitive
+        ) or [Text("(no attribute changes)", "dim")]
+
+
+class PlanChanges:
+    """The changes of a saved plan, indexed by resource address and grouped by module"""
+
+    def __init__(self, document: dict):
+        self.changes = {}
+        self.modules = {}
+        for change in document.get("resource_changes", []):
+            resource = ResourceChange(change)
+            if resource.action == ("no-op",):
+                continue
+            self.changes[resource.address] = resource
+            self.modules.setdefault(resource.module, []).append(resource.address)
+
+    def find(self, pattern: str) -> list[str]:
+        """Addresses matching a wildcard pattern, or containing the text if it has no wildcards"""
+        if "*" in pattern or "?" in pattern:
+            # brackets are part of addresses, not character classes
+            pattern = pattern.replace("[", "[[]")
+            return [
+                address for address in self.changes if fnmatchcase(address, pattern)
+            ]
+        return [address for address in self.changes if pattern in address]
+
+    @staticmethod
+    async def load(executable: str, planfile=PLAN_FILE) -> "PlanChanges":
+        returncode, stdout = await execute_async(
+            executable, "show", "-json", planfile, priority=Command.FOREGROUND
+        )
+        if returncode != 0:
+            raise Exception(stdout)
+        # a plan of a large refactor is a big document, parse it off the event loop
+        changes = await asyncio.to_thread(lambda: PlanChanges(json.loads(stdout)))
+        logger.debug(
+            "Loaded plan changes: %s",
+            json.dumps({"resources": len(changes.changes)}, indent=2),
+        )
+        return changes
@@ -0,0 +1,102 @@
+import argparse
+from tftui.apis import OutboundAPIs
+from tftui.state import State
+
+
+def parse_command_line() -> argparse.Namespace:
+    """Parses the arguments and handles --version, before the UI modules are imported"""
+    parser = argparse.ArgumentParser(
+        prog="tftui",
+        description="TFTUI - the Terraform terminal UI",
+        epilog="Enjoy!",
+    )
+    parser.add_argument(
+        "-e",
+        "--executable",
+        help="set executable command (default 'terraform')",
+    )
+    parser.add_argument(
+        "-n",
+        "--no-init",
+        help="do not run terraform init on startup (default run)",
+        action="store_true",
+    )
+    parser.add_argument(
+        "-f",
+        "--var-file",
+        help="tfvars filename to be used in planning",
+    )
+    parser.add_argument(
+        "-s",
+        "--state-source",
+        choices=State.SOURCES,
+        help="how to load the state: 'show' (show -no-color and show -json), 'json' (a single show -json) "
+        "or 'pull' (state pull, no provider loading; default 'show')",
+    )
+    parser.add_argument(
+        "-c",
+        "--no-cache",
+        help="do not cache the parsed state and the plans under the terraform data dir (default cache)",
+        action="store_true",
+    )
+    parser.add_argument(
+        "-b",
+        "--batch-state",
+        help="delete/taint/untaint many resources with a single state pull and push, keeping a backup "
+        "(default one terraform command per resource)",
+        action="store_true",
+    )
+    parser.add_argument(
+        "-j",
+        "--json-events",
+        help="run plan and apply with -json, showing a live status table of the resources "
+        "(default human-readable output)",
+        action="store_true",
+    )
+    parser.add_argument(
+        "-o",
+        "--offline",
+        help="run in offline mode (i.e. no outbound API calls; default online)",
+        action="store_true",
+    )
+    parser.add_argument(
+        "-d",
+        "--disable-usage-tracking",
+        help="disable usage tracking (default enabled)",
+        action="store_true",
+    )
+    parser.add_argument(
+        "-l",
+        "--light-mode",
+        help="enable light mode (default dark)",
+        action="store_true",
+    )
+    parser.add_argument(
+        "-g",
+        "--generate-debug-log",
+        action="store_true",
+        help="generate debug log file (default disabled)",
+    )
+    parser.add_argument(
+        "-v", "--version", help="show version information", action="store_true"
+    )
+    args = parser.parse_args()
+
+    if args.offline or args.disable_usage_tracking:
+        OutboundAPIs.disable_usage_tracking()
+    if args.version:
+        if not args.offline:
+            OutboundAPIs.check_for_new_version()
+        print(
+            f"\ntftui v{OutboundAPIs.version}{' (new version available)' if OutboundAPIs.is_new_version_available else ''}\n"
+        )
+        exit(0)
+    return args
+
+
+def main() -> None:
+    args = parse_command_line()
+
+    from tftui.__main__ import main as run_application
+
+    run_application(args)
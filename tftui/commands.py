@@ -0,0 +1,277 @@
+import asyncio
+import codecs
+import itertools
+import json
+import os
+import signal
+import subprocess
+from tftui.debug_log import setup_logging
+
+logger = setup_logging()
+
+# per terraform root; commands that take the state lock also run one at a time
+COMMAND_CONCURRENCY = 4
+LOCKING_COMMANDS = [
+    ["apply"],
+    ["destroy"],
+    ["import"],
+    ["plan"],
+    ["refresh"],
+    ["taint"],
+    ["untaint"],
+    ["state", "mv"],
+    ["state", "push"],
+    ["state", "replace-provider"],
+    ["state", "rm"],
+]
+READ_SIZE = 64 * 1024
+# terraform stops gracefully on an interrupt (releasing the state lock), given a little time
+TERMINATE_TIMEOUT = 5
+# each command runs in its own process group, so stopping it also stops its provider plugins
+if os.name == "nt":
+    PROCESS_GROUP = {"creationflags": subprocess.CREATE_NEW_PROCESS_GROUP}
+else:
+    PROCESS_GROUP = {"start_new_session": True}
+
+schedulers = {}
+
+
+def scheduler() -> "CommandScheduler":
+    loop = asyncio.get_running_loop()
+    if loop not in schedulers:
+        schedulers.clear()
+        schedulers[loop] = CommandScheduler()
+    return schedulers[loop]
+
+
+def takes_state_lock(argv: list) -> bool:
+    words = [word for word in argv[1:] if not word.startswith("-")]
+    return any(words[: len(command)] == command for command in LOCKING_COMMANDS)
+
+
+class CommandPreempted(Exception):
+    pass
+
+
+async def terminate(process, grace=TERMINATE_TIMEOUT) -> None:
+    """Interrupts a process group like Ctrl+C would, then kills whatever is left of it
+
+    A grace of None waits for as long as the command needs to stop, e.g. for an apply.
+    """
+    try:
+        if os.name == "nt":
+            process.send_signal(signal.CTRL_BREAK_EVENT)
+        else:
+            os.killpg(process.pid, signal.SIGINT)
+        await asyncio.wait_for(process.wait(), grace)
+    except (ProcessLookupError, asyncio.TimeoutError):
+        pass
+    try:
+        # children that ignore interrupts (or outlive the command) would keep the output pipe open
+        if os.name != "nt":
+            os.killpg(process.pid, signal.SIGKILL)
+        elif process.returncode is None:
+            process.kill()
+    except ProcessLookupError:
+        pass
+    await process.wait()
+
+
+class Command:
+    """A command whose output is streamed line by line, and that is stopped when its worker is cancelled
+
+    Commands wait for the scheduler to give them a slot in their terraform root. A background
+    command is stopped (and raises CommandPreempted) as soon as an interactive one starts.
+    """
+
+    INTERACTIVE = 0
+    FOREGROUND = 1
+    BACKGROUND = 2
+
+    def __init__(
+        self,
+        *argv: str,
+        timeout: float = None,
+        grace=TERMINATE_TIMEOUT,
+        priority=FOREGROUND,
+        root: str = None,
+    ):
+        self.argv = list(argv)
+        self.timeout = timeout
+        self.grace = grace
+        self.priority = priority
+        self.root = root or os.getcwd()
+        self.locks_state = takes_state_lock(self.argv)
+        self.returncode = None
+        self.process = None
+        self.stopping = None
+
+    def preempt(self) -> None:
+        if (
+            self.process is not None
+            and self.process.returncode is None
+            and self.stopping is None
+        ):
+            logger.debug("Preempting command: %s", self.argv)
+            self.stopping = asyncio.ensure_future(terminate(self.process, self.grace))
+
+    async def lines(self):
+        """Yields the output lines (stdout and stderr, without line endings) while the command runs"""
+        await scheduler().acquire(self)
+        try:
+            self.process = process = await asyncio.create_subprocess_exec(
+                *self.argv,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.STDOUT,
+                **PROCESS_GROUP,
+            )
+            # a multi-byte character may be split between two reads
+            decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+            loop = asyncio.get_running_loop()
+            deadline = None if self.timeout is None else loop.time() + self.timeout
+            partial = []
+            try:
+                while True:
+                    try:
+                        data = await asyncio.wait_for(
+                            process.stdout.read(READ_SIZE),
+                            None if deadline is None else deadline - loop.time(),
+                        )
+                    except asyncio.TimeoutError:
+                        raise TimeoutError(
+                            f"{' '.join(self.argv)} timed out after {self.timeout}s"
+                        ) from None
+                    lines = decoder.decode(data, final=not data).split("\n")
+                    if len(lines) > 1:
+                        partial.append(lines[0])
+                        yield "".join(partial).rstrip("\r")
+                        for line in lines[1:-1]:
+                            yield line.rstrip("\r")
+                        partial = []
+                    if lines[-1]:
+                        partial.append(lines[-1])
+                    if not data:
+                        break
+                if partial:
+                    yield "".join(partial).rstrip("\r")
+                self.returncode = await process.wait()
+            finally:
+                if self.stopping is not None:
+                    await self.stopping
+                elif process.returncode is None:
+                    await terminate(process, self.grace)
+                logger.debug(
+                    "Executed command: %s",
+                    json.dumps(
+                        {
+                            "command": self.argv,
+                            "return_code": process.returncode,
+                            "preempted": self.stopping is not None,
+                        },
+                        indent=2,
+                    ),
+                )
+        finally:
+            scheduler().release(self)
+        if self.stopping is not None:
+            raise CommandPreempted(" ".join(self.argv))
+
+
+async def execute_async(
+    *command: str, timeout: float = None, priority=Command.FOREGROUND
+) -> tuple[int, str]:
+    """Runs a command to completion and returns its return code and output
+
+    A preempted background command runs again once the interactive commands of its root are done.
+    """
+    while True:
+        runner = Command(*command, timeout=timeout, priority=priority)
+        try:
+            lines = [line async for line in runner.lines()]
+        except CommandPreempted:
+            await scheduler().wait_for_interactive(runner.root)
+            continue
+        return (runner.returncode, "\n".join(lines))
+
+
+class CommandScheduler:
+    """Hands out command slots per terraform root, the most urgent commands first
+
+    Background commands don't start while an interactive command runs or waits in the same root.
+    """
+
+    def __init__(self, concurrency=COMMAND_CONCURRENCY):
+        self.concurrency = concurrency
+        self.running = {}
+        self.waiting = []
+        self.sequence = itertools.count()
+        self.idle = {}
+
+    def interactive(self, root: str) -> bool:
+        return any(
+            command.priority == Command.INTERACTIVE
+            for command in self.running.get(root, [])
+        ) or any(
+            command.root == root and command.priority == Command.INTERACTIVE
+            for _, _, command, _ in self.waiting
+        )
+
+    def can_start(self, command: Command) -> bool:
+        running = self.running.get(command.root, [])
+        if len(running) >= self.concurrency:
+            return False
+        if command.locks_state and any(other.locks_state for other in running):
+            return False
+        if command.priority == Command.BACKGROUND and self.interactive(command.root):
+            return False
+        return True
+
+    async def acquire(self, command: Command) -> None:
+        if command.priority == Command.INTERACTIVE:
+            for other in self.running.get(command.root, []):
+                if other.priority == Command.BACKGROUND:
+                    other.preempt()
+        future = asyncio.get_running_loop().create_future()
+        self.waiting.append((command.priority, next(self.sequence), command, future))
+        self.wake()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release(command)
+            else:
+                self.waiting = [
+                    entry for entry in self.waiting if entry[3] is not future
+                ]
+                self.wake()
+            raise
+
+    def release(self, command: Command) -> None:
+        running = self.running.get(command.root, [])
+        if command in running:
+            running.remove(command)
+        self.wake()
+
+    def wake(self) -> None:
+        # waiting commands stay listed until they start, so background ones still see them
+        for entry in sorted(self.waiting, key=lambda entry: entry[:2]):
+            _, _, command, future = entry
+            if future.done():
+                self.waiting.remove(entry)
+            elif self.can_start(command):
+                self.waiting.remove(entry)
+                self.running.setdefault(command.root, []).append(command)
+                future.set_result(None)
+        for root, events in list(self.idle.items()):
+            if not self.interactive(root):
+                for event in events:
+                    event.set()
+                del self.idle[root]
+
+    async def wait_for_interactive(self, root: str) -> None:
+        """Returns once no interactive command runs or waits in the root"""
+        if not self.interactive(root):
+            return
+        event = asyncio.Event()
+        self.idle.setdefault(root, []).append(event)
+        await event.wait()
@@ -0,0 +1,167 @@
+import json
+import time
+
+# the description of a planned action, as it appears in terraform's human readable output
+ACTION_DESCRIPTIONS = {
+    "create": "will be created",
+    "read": "will be read during apply",
+    "update": "will be updated in-place",
+    "replace": "must be replaced",
+    "delete": "will be destroyed",
+    "move": "has moved",
+    "import": "will be imported",
+    "remove": "will be removed from the state",
+}
+
+
+class ResourceStatus:
+    PLANNED = "planned"
+    APPLYING = "applying"
+    COMPLETE = "complete"
+    ERRORED = "errored"
+    STATUSES = [PLANNED, APPLYING, COMPLETE, ERRORED]
+
+    __slots__ = ("address", "action", "status", "started", "elapsed")
+
+    def __init__(self, address: str, action: str):
+        self.address = address
+        self.action = action
+        self.status = None
+        self.started = None
+        self.elapsed = None
+
+
+class EventStream:
+    """Follows the newline-delimited events of `terraform plan -json` and `terraform apply -json`
+
+    Each event costs a json.loads and a few dictionary updates, whatever the size of the run.
+    """
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self.started = clock()
+        self.resources = {}
+        self.applying = set()
+        self.counts = dict.fromkeys(ResourceStatus.STATUSES, 0)
+        self.diagnostics = []
+        self.summary = None
+        self.apply_started = None
+        self.handlers = {
+            "planned_change": self.planned_change,
+            "apply_start": self.apply_start,
+            "apply_progress": self.apply_progress,
+            "apply_complete": self.apply_complete,
+            "apply_errored": self.apply_errored,
+            "change_summary": self.change_summary,
+            "diagnostic": self.diagnostic,
+        }
+
+    def restart(self) -> None:
+        """Restarts the elapsed time, e.g. when the apply of the planned changes starts"""
+        self.started = self.clock()
+
+    def resource(self, hook: dict) -> ResourceStatus:
+        address = hook.get("resource", {}).get("addr", "")
+        resource = self.resources.get(address)
+        if resource is None:
+            resource = ResourceStatus(address, hook.get("action", ""))
+            self.resources[address] = resource
+            # the apply of a saved plan doesn't repeat the planned changes, and a resource may
+            # first appear in any event
+            self.set_status(resource, ResourceStatus.PLANNED)
+        return resource
+
+    def set_status(self, resource: ResourceStatus, status: str) -> None:
+        if resource.status is not None:
+            self.counts[resource.status] -= 1
+        resource.status = status
+        self.counts[status] += 1
+        if status == ResourceStatus.APPLYING:
+            self.applying.add(resource.address)
+        else:
+            self.applying.discard(resource.address)
+
+    def consume(self, line: str) -> "tuple[ResourceStatus | None, str | None]":
+        """Returns the resource whose status changed and the line to show, if any, for an event"""
+        try:
+            event = json.loads(line)
+        except ValueError:
+            # e.g. a crash or a provider writing to the output directly
+            return None, line
+        handler = self.handlers.get(event.get("type"))
+        if handler is None:
+            return None, event.get("@message")
+        return handler(event)
+
+    def planned_change(self, event: dict):
+        change = event.get("change", {})
+        resource = self.resource(change)
+        resource.action = change.get("action", "")
+        self.set_status(resource, ResourceStatus.PLANNED)
+        description = ACTION_DESCRIPTIONS.get(resource.action, resource.action)
+        return resource, f"  # {resource.address} {description}"
+
+    def apply_start(self, event: dict):
+        resource = self.resource(event.get("hook", {}))
+        resource.started = self.clock()
+        if self.apply_started is None:
+            self.apply_started = resource.started
+        self.set_status(resource, ResourceStatus.APPLYING)
+        return resource, event.get("@message")
+
+    def apply_progress(self, event: dict):
+        hook = event.get("hook", {})
+        resource = self.resource(hook)
+        resource.elapsed = hook.get("elapsed_seconds", resource.elapsed)
+        return resource, None
+
+    def apply_complete(self, event: dict):
+        hook = event.get("hook", {})
+        resource = self.resource(hook)
+        resource.elapsed = hook.get("elapsed_seconds", resource.elapsed)
+        self.set_status(resource, ResourceStatus.COMPLETE)
+        return resource, event.get("@message")
+
+    def apply_errored(self, event: dict):
+        hook = event.get("hook", {})
+        resource = self.resource(hook)
+        resource.elapsed = hook.get("elapsed_seconds", resource.elapsed)
+        self.set_status(resource, ResourceStatus.ERRORED)
+        return resource, event.get("@message")
+
+    def change_summary(self, event: dict):
+        self.summary = event.get("@message")
+        return None, self.summary
+
+    def diagnostic(self, event: dict):
+        diagnostic = event.get("diagnostic", {})
+        self.diagnostics.append(diagnostic)
+        message = f"{diagnostic.get('severity', 'error').capitalize()}: {diagnostic.get('summary', '')}"
+        if diagnostic.get("detail"):
+            message += f"\n\n{diagnostic['detail']}"
+        return None, message
+
+    def elapsed(self, resource: ResourceStatus) -> "float | None":
+        if resource.status == ResourceStatus.APPLYING and resource.started is not None:
+            return self.clock() - resource.started
+        return resource.elapsed
+
+    def eta(self) -> "float | None":
+        """Seconds until every resource is applied, at the rate resources were applied so far"""
+        done = (
+            self.counts[ResourceStatus.COMPLETE] + self.counts[ResourceStatus.ERRORED]
+        )
+        remaining = len(self.resources) - done
+        if self.apply_started is None or not done or not remaining:
+            return None
+        return (self.clock() - self.apply_started) / done * remaining
+
+    def progress(self) -> str:
+        counts = ", ".join(
+            f"{count} {status}" for status, count in self.counts.items() if count
+        )
+        progress = f"{counts or 'no changes'} in {self.clock() - self.started:.0f}s"
+        eta = self.eta()
+        if eta is not None:
+            progress += f", about {eta:.0f}s left"
+        return progress
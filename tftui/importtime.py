@@ -0,0 +1,64 @@
+import subprocess
+import sys
+
+# cumulative import time of the entry point, measured with `python -X importtime`
+IMPORT_TIME_BUDGET_MS = 750
+# modules that are only needed by some actions, and must be imported where they are used
+LAZY_MODULES = ["requests", "pyperclip", "posthog", "tftui.constants"]
+FIRST_FRAME = "tftui: first frame"
+# runs the application as `tftui` does, headless and without the version check (which has its
+# own thread), until its first frame
+STARTUP = f"""
+import os
+import sys
+import tftui.__main__ as tftui
+
+
+def first_frame(app):
+    print({FIRST_FRAME!r}, file=sys.stderr, flush=True)
+    os._exit(0)
+
+
+tftui.ApplicationGlobals.check_version = False
+tftui.TerraformTUI.on_ready = first_frame
+tftui.TerraformTUI.run = lambda app: tftui.App.run(app, headless=True)
+sys.argv = ["tftui", "--executable", sys.executable]
+tftui.main()
+"""
+
+
+def measure_imports() -> dict[str, int]:
+    """Returns the cumulative import time of every module imported until the first frame, in us"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", STARTUP],
+        capture_output=True,
+        text=True,
+    )
+    timings = {}
+    for line in result.stderr.splitlines():
+        if line == FIRST_FRAME:
+            return timings
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        timings[name.strip()] = int(cumulative)
+    raise Exception(f"tftui did not reach its first frame:\n{result.stderr[-2000:]}")
+
+
+def check_imports(budget_ms=IMPORT_TIME_BUDGET_MS) -> bool:
+    timings = measure_imports()
+    total_ms = timings["tftui.__main__"] / 1000
+    print(f"tftui.__main__ imports in {total_ms:.0f}ms (budget {budget_ms}ms)")
+    for name, cumulative in sorted(timings.items(), key=lambda item: -item[1])[1:11]:
+        print(f"  {cumulative / 1000:8.1f}ms  {name}")
+    eager = [name for name in LAZY_MODULES if name in timings]
+    for name in eager:
+        print(
+            f"{name} is imported before the first frame, it should be imported where it is used"
+        )
+    return total_ms <= budget_ms and not eager
+
+
+if __name__ == "__main__":
+    budget_ms = int(sys.argv[1]) if len(sys.argv) > 1 else IMPORT_TIME_BUDGET_MS
+    exit(0 if check_imports(budget_ms) else 1)
@@ -102,6 +102,7 @@ class YesNoModal(ModalScreen):
 class PlanInputsModal(ModalScreen):
     input = None
     checkbox = None
+    replan = None
     var_file = None
 
     def __init__(self, var_file, targets=False, *args, **kwargs):
@@ -113,6 +114,11 @@ class PlanInputsModal(ModalScreen):
             id="plantarget",
             value=targets,
         )
+        self.replan = Checkbox(
+            "Re-plan even if nothing changed since the last plan",
+            id="replan",
+            value=False,
+        )
 
     def compose(self) -> ComposeResult:
         question = Static(
@@ -124,6 +130,7 @@ class PlanInputsModal(ModalScreen):
             question,
             Horizontal(Static("Var-file:", id="varfilelabel"), self.input),
             self.checkbox,
+            self.replan,
             Button("Yes", variant="primary", id="yes"),
             Button("No", id="no"),
             id="tfvars",
@@ -132,18 +139,18 @@ class PlanInputsModal(ModalScreen):
 
     def on_button_pressed(self, event: Button.Pressed) -> None:
         if event.button.id == "yes":
-            self.dismiss((self.input.value, self.checkbox.value))
+            self.dismiss((self.input.value, self.checkbox.value, self.replan.value))
         else:
             self.dismiss(None)
 
     def on_key(self, event) -> None:
         if event.key == "y":
-            self.dismiss((self.input.value, self.checkbox.value))
+            self.dismiss((self.input.value, self.checkbox.value, self.replan.value))
         elif event.key == "n" or event.key == "escape":
             self.dismiss(None)
 
     def on_input_submitted(self, event: Input.Submitted) -> None:
-        self.dismiss((self.input.value, self.checkbox.value))
+        self.dismiss((self.input.value, self.checkbox.value, self.replan.value))
 
 
 class HelpModal(ModalScreen):
@@ -151,6 +158,7 @@ class HelpModal(ModalScreen):
         ("ENTER", "View resource details"),
         ("ESC", "Go back"),
         ("S / Space", "Select current resource (toggle)"),
+        ("Ctrl+A", "Select all resources shown in the tree (toggle)"),
         ("F", "Show resource/plan on full screen; Hold SHIFT/OPTIONS to copy text"),
         ("X", "Expose sensitive values in resource screen"),
         ("D", "Delete selected resources, or highlighted resource if none is selected"),
@@ -163,14 +171,23 @@ class HelpModal(ModalScreen):
         ("R", "Refresh state tree"),
         (
             "P",
-            "Create execution plan, with an optional var-file and target list",
+            "Create execution plan, with an optional var-file and target list; a plan whose inputs didn't change is reused",
         ),
         (
             "Ctrl+D",
             "Create destruction plan, with an optional var-file and target list",
         ),
         ("A", "Apply current plan, available only if a valid plan was created"),
+        (
+            "V",
+            "Switch between the plan output, the tree of its changes and the status of its resources (-j)",
+        ),
         ("/", "Filter tree based on text inside resources names and descriptions"),
+        (
+            "",
+            "or by fields: type:, module:, mode:, tainted:, provider:, name:, attr:path=value (-field: excludes, * matches any)",
+        ),
+        ("", "in the plan tree, filter resources by address (* matches any)"),
         ("0-9", "Collapse the state tree to the selected level, 0 expands all nodes"),
         ("W", "Switch workspace"),
         ("M", "Toggle dark mode"),
@@ -0,0 +1,81 @@
+from tftui.commands import Command, execute_async
+from tftui.debug_log import setup_logging
+
+logger = setup_logging()
+
+# Windows caps a command line at 32767 characters, far below the argv limit of other platforms
+ARGV_MAX_LENGTH = 30_000
+# only `state rm` accepts several addresses, taint and untaint take exactly one
+BATCH_COMMANDS = {"delete": ["state", "rm"]}
+SINGLE_COMMANDS = {"taint": ["taint"], "untaint": ["untaint"]}
+
+
+def chunk_addresses(addresses: list, max_length=ARGV_MAX_LENGTH) -> list[list[str]]:
+    """Splits addresses into chunks whose total length (with separators) stays under max_length"""
+    chunks = []
+    chunk = []
+    length = 0
+    for address in addresses:
+        if chunk and length + len(address) + 1 > max_length:
+            chunks.append(chunk)
+            chunk = []
+            length = 0
+        chunk.append(address)
+        length += len(address) + 1
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+
+def error_summary(output: str) -> str:
+    """Returns the `Error: ...` line of terraform's output, or its last line"""
+    lines = [line.strip("│ ") for line in output.splitlines() if line.strip("│ ")]
+    for line in lines:
+        if line.startswith("Error:"):
+            return line
+    return lines[-1] if lines else "failed"
+
+
+def plan_operations(action: str, addresses: list) -> list[tuple[list, list]]:
+    """Returns the (subcommand, addresses) invocations that perform an action on all addresses"""
+    if action in BATCH_COMMANDS:
+        return [
+            (BATCH_COMMANDS[action], chunk)
+            for chunk in chunk_addresses(
+                addresses, ARGV_MAX_LENGTH - len(" ".join(BATCH_COMMANDS[action])) - 64
+            )
+        ]
+    if action in SINGLE_COMMANDS:
+        return [(SINGLE_COMMANDS[action], [address]) for address in addresses]
+    raise ValueError(f"Unknown action: {action}")
+
+
+async def run_operations(
+    executable: str, action: str, addresses: list, progress=None
+) -> dict[str, str]:
+    """Runs the planned invocations one after another, since each of them takes the state lock
+
+    Returns the error of every address that failed. `progress(done, total)` is called after each
+    invocation. A batch that fails is retried address by address to find out which ones failed.
+    """
+    failures = {}
+    done = 0
+    for subcommand, chunk in plan_operations(action, addresses):
+        returncode, stdout = await execute_async(
+            executable, *subcommand, *chunk, priority=Command.INTERACTIVE
+        )
+        if returncode != 0 and len(chunk) > 1:
+            for address in chunk:
+                returncode, stdout = await execute_async(
+                    executable, *subcommand, address, priority=Command.INTERACTIVE
+                )
+                if returncode != 0:
+                    failures[address] = stdout.strip()
+        elif returncode != 0:
+            failures[chunk[0]] = stdout.strip()
+        done += len(chunk)
+        if progress is not None:
+            progress(done, len(addresses))
+    if failures:
+        logger.error("Failed to %s: %s", action, "\n".join(failures))
+    return failures
@@ -1,40 +1,235 @@
 import asyncio
+from tftui.cache import current_workspace, plan_fingerprint
+from tftui.changes import PLAN_FILE, PlanChanges, ResourceChange
+from tftui.commands import Command
 from tftui.debug_log import setup_logging
+from tftui.events import EventStream, ResourceStatus
 from textual import work
-from textual.widgets import RichLog
+from textual.geometry import Size
+from textual.strip import Strip
+from textual.widgets import DataTable, RichLog, Tree
 from textual.worker import Worker
 from rich.text import Text
 
 logger = setup_logging()
 
+# the output is rendered at most once per frame, from a queue of at most WRITER_QUEUE_SIZE lines
+FRAME_INTERVAL = 1 / 30
+WRITER_QUEUE_SIZE = 20_000
+FRAME_LINES = 2_000
+# leaving these views for any other discards the plan
+PLAN_VIEWS = ("plan", "plantree", "planstatus")
+STATUS_STYLES = {
+    ResourceStatus.PLANNED: "",
+    ResourceStatus.APPLYING: "yellow3",
+    ResourceStatus.COMPLETE: "green3",
+    ResourceStatus.ERRORED: "bold red",
+}
+
+
+def style_line(line: str, block_color: str) -> tuple[Text, str]:
+    """Styles a line of plan output, returns it with the color of the resource block it is in"""
+    stylzed_line = Text(line)
+    if line == "":
+        block_color = ""
+    elif line.startswith("Plan:"):
+        stylzed_line.stylize("bold")
+    elif line.startswith("  #"):
+        if line.endswith("will be destroyed") or line.endswith("must be replaced"):
+            block_color = "red"
+        elif line.endswith("will be created"):
+            block_color = "green3"
+        elif line.endswith("will be updated in-place"):
+            block_color = "yellow3"
+        stylzed_line.stylize(f"bold {block_color}")
+    elif line.strip().startswith("-"):
+        stylzed_line.stylize("red")
+    elif line.strip().startswith("+"):
+        stylzed_line.stylize("green3")
+    elif line.strip().startswith("~") and "->" in line:
+        stylzed_line = Text.assemble(
+            (line[: line.find("=") + 1], block_color),
+            (line[line.find("=") + 1 : line.find("->")], "red"),
+            (line[line.find("->") :], "green3"),
+        )
+    else:
+        stylzed_line.stylize(block_color)
+    return stylzed_line, block_color
+
+
+class PlanModel:
+    """Append-only store of the styled lines of a plan (or apply) output
+
+    Lines are kept once; the summary and the full text are built from them on demand, in one pass.
+    """
+
+    def __init__(self, full=False):
+        self.lines = []
+        # indexes of the `  # resource will be ...` headers and of the `Plan: ...` totals
+        self.headers = []
+        self.totals = []
+        # the full text starts where terraform starts listing the actions of the plan
+        self.start = 0 if full else None
+
+    def append(self, line: Text) -> bool:
+        """Stores a styled line, returns whether the full text restarts at it"""
+        plain = line.plain
+        restart = (
+            plain.startswith("No changes.")
+            or plain == "Terraform will perform the following actions:"
+        )
+        if restart:
+            self.start = len(self.lines)
+        elif plain.startswith("Plan:"):
+            self.totals.append(len(self.lines))
+        elif plain.startswith("  #"):
+            self.headers.append(len(self.lines))
+        self.lines.append(line)
+        return restart
+
+    def summary(self) -> Text:
+        """The totals (latest first), followed by the header of every changed resource"""
+        summary = Text("")
+        for index in reversed(self.totals):
+            summary.append_text(self.lines[index])
+            summary.append("\n\n")
+        for index in self.headers:
+            summary.append_text(self.lines[index])
+            summary.append("\n")
+        return summary
+
+    def fulltext(self) -> "Text | None":
+        if self.start is None:
+            return None
+        return Text("\n").join(self.lines[self.start :])
+
+
+async def replay(lines: list):
+    for line in lines:
+        yield line
+
+
+class FrameWriter:
+    """Writes lines to the plan screen in batches, at most once per frame however fast they arrive
+
+    The queue is bounded: once it is full, the command's output waits in the pipe until the
+    widget catches up. Each frame renders at most FRAME_LINES lines, so the UI stays responsive.
+    """
+
+    CLEAR = object()
+
+    def __init__(
+        self,
+        log: "PlanScreen",
+        progress=None,
+        interval=FRAME_INTERVAL,
+        limit=WRITER_QUEUE_SIZE,
+    ):
+        self.log = log
+        self.progress = progress
+        self.interval = interval
+        self.queue = asyncio.Queue(limit)
+        self.rendered = 0
+        self.flusher = asyncio.create_task(self.flush_frames())
+
+    async def write(self, line: Text) -> None:
+        await self.queue.put(line)
+
+    async def clear(self) -> None:
+        """Clears the widget, once the lines written before are flushed"""
+        await self.queue.put(self.CLEAR)
+
+    def flush(self, item) -> None:
+        """Renders an item and the ones queued after it, up to a frame's worth of lines"""
+        lines = []
+        while True:
+            if item is self.CLEAR:
+                # the lines queued before are dropped without being written
+                self.log.clear()
+                self.rendered = 0
+                lines = []
+            else:
+                lines.append(item)
+            if len(lines) >= FRAME_LINES or self.queue.empty():
+                break
+            item = self.queue.get_nowait()
+        if lines:
+            self.log.write_lines(lines)
+            self.rendered += len(lines)
+        if self.progress is not None:
+            self.progress(self.rendered, self.queue.qsize())
+
+    async def flush_frames(self) -> None:
+        while True:
+            # sleeps until there is something to render, then renders at most once per frame
+            self.flush(await self.queue.get())
+            await asyncio.sleep(self.interval)
+
+    async def drain(self) -> None:
+        """Returns once every line written is rendered"""
+        while not self.queue.empty():
+            await asyncio.sleep(self.interval)
+
+    def stop(self) -> None:
+        # lines left in the queue belong to a cancelled command, and are dropped
+        self.flusher.cancel()
+
 
 class PlanScreen(RichLog):
     executable = None
+    json_events = False
+    cache = None
     active_plan = None
-    fulltext = None
+    output = None
 
     BINDINGS = []
 
-    def __init__(self, id, executable, *args, **kwargs):
+    def __init__(self, id, executable, json_events=False, cache=None, *args, **kwargs):
         super().__init__(id=id, *args, **kwargs)
         self.executable = executable
+        self.json_events = json_events
+        self.cache = cache
         self.active_plan = ""
+        self.output = PlanModel()
         self.wrap = True
 
+    @property
+    def fulltext(self) -> "Text | None":
+        return self.output.fulltext()
+
+    async def fingerprint(self, command: list, varfile) -> "str | None":
+        """Fingerprints the inputs of a plan, None when the state's serial is unknown"""
+        # a remote state isn't pulled for this, the serial it was last loaded with is used
+        lineage, serial = await self.app.tree.current_state.probe_serial(pull=False)
+        if serial is None:
+            return None
+        inputs = {
+            "command": command,
+            "workspace": current_workspace(),
+            "lineage": lineage,
+            "serial": serial,
+        }
+        return await asyncio.to_thread(plan_fingerprint, inputs, varfile)
+
     @work(exclusive=True)
-    async def create_plan(self, varfile, targets, destroy="") -> None:
+    async def create_plan(self, varfile, targets, destroy="", replan=False) -> None:
         self.active_plan = Text("")
         self.auto_scroll = False
         self.parent.loading = True
-        self.fulltext = None
+        # terraform's events don't include the "Terraform will perform..." line
+        self.output = PlanModel(full=self.json_events)
         self.app.switcher.border_title = ""
+        self.app.plantree.show_changes(None)
+        self.app.planstatus.reset()
+        if self.json_events:
+            self.app.switcher.current = "planstatus"
         self.clear()
         command = [
             self.executable,
             "plan",
-            "-no-color",
+            "-json" if self.json_events else "-no-color",
             "-input=false",
-            "-out=tftui.plan",
+            f"-out={PLAN_FILE}",
             "-detailed-exitcode",
         ]
         if varfile:
@@ -45,87 +240,60 @@ class PlanScreen(RichLog):
             for target in targets:
                 command.append(f"-target={target}")
 
-        logger.debug(f"Executing command: {command}")
-        proc = await asyncio.create_subprocess_exec(
-            *command,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.STDOUT,
+        fingerprint = (
+            None if self.cache is None else await self.fingerprint(command, varfile)
         )
+        cached = (
+            None
+            if fingerprint is None or replan
+            else self.cache.load(fingerprint, PLAN_FILE)
+        )
+        if cached is None:
+            logger.debug(f"Executing command: {command}")
+            proc = Command(*command, priority=Command.INTERACTIVE)
+            lines = proc.lines()
+        else:
+            logger.debug("Reusing the cached plan %s", fingerprint[:12])
+            self.app.notify(
+                "Nothing changed since this plan was created, showing it again (re-plan to run terraform)"
+            )
+            lines = replay(cached["output"])
 
         block_color = ""
+        # the raw output is only kept for a plan that is going into the cache
+        output = [] if cached is None and fingerprint is not None else None
+        writer = FrameWriter(self, self.show_progress)
 
         try:
-            while True:
-                data = await proc.stdout.readline()
-                if not data:
-                    break
-
-                self.parent.loading = False
-                stripped_line = data.decode("utf-8").rstrip()
-                stylzed_line = Text(stripped_line)
-
-                if (
-                    stripped_line.startswith("No changes.")
-                    or stripped_line == "Terraform will perform the following actions:"
-                ):
-                    self.clear()
+            async for line in lines:
+                if output is not None:
+                    output.append(line)
+                if self.parent.loading:
+                    self.parent.loading = False
+                if self.json_events:
+                    line = self.app.planstatus.consume(line)
+                    if line is None:
+                        continue
+                stylzed_line, block_color = style_line(line.rstrip(), block_color)
+                if self.output.append(stylzed_line):
+                    await writer.clear()
                     self.auto_scroll = False
-                    self.fulltext = Text("")
-
-                if stripped_line == "":
-                    block_color = ""
-                elif stripped_line.startswith("Plan:"):
-                    stylzed_line.stylize("bold")
-                    self.active_plan = self.active_plan.assemble(
-                        stylzed_line,
-                        Text("\n\n"),
-                        self.active_plan,
-                    )
-                elif stripped_line.startswith("  #"):
-                    if stripped_line.endswith(
-                        "will be destroyed"
-                    ) or stripped_line.endswith("must be replaced"):
-                        block_color = "red"
-                    elif stripped_line.endswith("will be created"):
-                        block_color = "green3"
-                    elif stripped_line.endswith("will be updated in-place"):
-                        block_color = "yellow3"
-                    stylzed_line.stylize(f"bold {block_color}")
-                    self.active_plan = self.active_plan.assemble(
-                        self.active_plan,
-                        stylzed_line,
-                        Text("\n"),
-                    )
-                elif stripped_line.strip().startswith("-"):
-                    stylzed_line.stylize("red")
-                elif stripped_line.strip().startswith("+"):
-                    stylzed_line.stylize("green3")
-                elif stripped_line.strip().startswith("~") and "->" in stripped_line:
-                    stylzed_line = Text.assemble(
-                        (stripped_line[: stripped_line.find("=") + 1], block_color),
-                        (
-                            stripped_line[
-                                stripped_line.find("=") + 1 : stripped_line.find("->")
-                            ],
-                            "red",
-                        ),
-                        (stripped_line[stripped_line.find("->") :], "green3"),
-                    )
-                else:
-                    stylzed_line.stylize(block_color)
-
-                self.write(stylzed_line)
-
-                if self.fulltext is not None:
-                    self.fulltext += stylzed_line + Text("\n")
+                await writer.write(stylzed_line)
+            await writer.drain()
 
         finally:
-            await proc.wait()
-            if proc.returncode != 2:
-                self.active_plan = None
+            writer.stop()
+            returncode = proc.returncode if cached is None else cached["returncode"]
+            self.active_plan = self.output.summary() if returncode == 2 else None
+
+        if output is not None and returncode in (0, 2):
+            self.cache.store(
+                fingerprint, PLAN_FILE, {"returncode": returncode, "output": output}
+            )
 
         if self.active_plan:
             self.app.switcher.border_title = self.active_plan.plain.split("\n")[0]
+            self.app.plantree.load_changes()
 
         self.focus()
 
@@ -133,40 +301,208 @@ class PlanScreen(RichLog):
     async def execute_apply(self) -> None:
         self.parent.loading = True
         self.auto_scroll = True
-        self.fulltext = Text("")
-        command = [self.executable, "apply", "-no-color", "tftui.plan"]
+        self.output = PlanModel(full=True)
+        self.app.plantree.show_changes(None)
+        # the plan's views don't describe the apply, so show one that follows it
+        if self.json_events:
+            self.app.planstatus.stream.restart()
+            self.app.switcher.current = "planstatus"
+        else:
+            self.app.switcher.current = "plan"
+        command = [
+            self.executable,
+            "apply",
+            "-json" if self.json_events else "-no-color",
+            PLAN_FILE,
+        ]
 
         logger.debug(f"Executing command: {command}")
-        proc = await asyncio.create_subprocess_exec(
-            *command,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.STDOUT,
-        )
+        # killing an apply could lose the state of the resources it is changing
+        proc = Command(*command, grace=None, priority=Command.INTERACTIVE)
 
         self.clear()
+        writer = FrameWriter(self, self.show_progress)
 
         try:
-            while True:
-                data = await proc.stdout.readline()
-                if not data:
-                    break
-                self.parent.loading = False
-                text = Text(data.decode("utf-8").rstrip())
+            async for line in proc.lines():
+                if self.parent.loading:
+                    self.parent.loading = False
+                if self.json_events:
+                    line = self.app.planstatus.consume(line)
+                    if line is None:
+                        continue
+                text = Text(line.rstrip())
                 if text.plain.startswith("Apply complete!"):
                     text.stylize("bold white")
-                self.write(text)
-                self.fulltext += text + Text("\n")
+                await writer.write(text)
+                self.output.append(text)
+            await writer.drain()
         finally:
-            await proc.wait()
+            writer.stop()
             self.active_plan = ""
 
-    def on_hide(self) -> None:
+    def write_lines(self, lines: list[Text]) -> None:
+        """Appends lines, rendering the ones that fit the width straight into strips
+
+        RichLog.write measures, wraps and pads what it writes, which costs far more than rendering
+        a short line; only the lines that need wrapping go through it. The strips appended directly
+        get the same bookkeeping as in RichLog.write, once for the whole batch.
+        """
+        width = self.scrollable_content_region.width
+        console = self.app.console
+        for line in lines:
+            if (
+                width
+                and line.cell_len <= width
+                and "\n" not in line.plain
+                and "\t" not in line.plain
+            ):
+                self.lines.append(Strip(line.render(console), line.cell_len))
+                self.max_width = max(self.max_width, line.cell_len)
+            else:
+                self.write(line, scroll_end=False)
+        if self.max_lines is not None and len(self.lines) > self.max_lines:
+            self._start_line += len(self.lines) - self.max_lines
+            self.refresh()
+            self.lines = self.lines[-self.max_lines :]
+        self.virtual_size = Size(self.max_width, len(self.lines))
+        if self.auto_scroll:
+            self.scroll_end(animate=False)
+
+    def show_progress(self, rendered: int, buffered: int) -> None:
+        if self.app.switcher.current == "plan":
+            self.app.switcher.border_subtitle = (
+                f"{rendered} lines rendered, {buffered} buffered"
+                if buffered
+                else f"{rendered} lines"
+            )
+
+    def discard(self) -> None:
         self.active_plan = ""
         self.clear()
+        self.app.plantree.show_changes(None)
+        self.app.planstatus.reset()
+
+    def on_hide(self) -> None:
+        self.app.switcher.border_subtitle = ""
+        if self.app.switcher.current not in PLAN_VIEWS:
+            self.discard()
 
     async def on_worker_state_changed(self, event: Worker.StateChanged) -> None:
         if (
             event.worker.name == "execute_apply"
             and event.worker.state.name == "SUCCESS"
         ):
-            self.app.tree.refresh_state(focus=False)
+            self.app.tree.refresh_state(focus=False, changed=True)
+
+
+class PlanTree(Tree):
+    """The changes of the saved plan, one node per resource whose diff is rendered when expanded"""
+
+    changes = None
+    pattern = ""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.show_root = False
+
+    @work(exclusive=True, group="plantree")
+    async def load_changes(self) -> None:
+        try:
+            changes = await PlanChanges.load(self.app.plan.executable)
+        except Exception as e:
+            logger.error("Failed loading the plan changes: %s", e)
+            return
+        self.show_changes(changes)
+
+    def show_changes(self, changes: "PlanChanges | None", pattern="") -> None:
+        self.changes = changes
+        self.pattern = pattern
+        self.clear()
+        if changes is None:
+            return
+        addresses = set(changes.find(pattern)) if pattern else changes.changes
+        for module, module_addresses in changes.modules.items():
+            shown = [address for address in module_addresses if address in addresses]
+            if not shown:
+                continue
+            parent = (
+                self.root.add(f"{module} ({len(shown)})", expand=bool(pattern))
+                if module
+                else self.root
+            )
+            for address in shown:
+                change = changes.changes[address]
+                parent.add(change.label, data=change, allow_expand=True)
+        self.root.expand()
+
+    def filter(self, pattern: str) -> None:
+        if self.changes is not None and pattern != self.pattern:
+            self.show_changes(self.changes, pattern)
+
+    def on_tree_node_expanded(self, event: Tree.NodeExpanded) -> None:
+        node = event.node
+        if isinstance(node.data, ResourceChange) and not node.children:
+            for line in node.data.diff():
+                node.add_leaf(line)
+
+    def on_hide(self) -> None:
+        if self.app.switcher.current not in PLAN_VIEWS:
+            self.app.plan.discard()
+
+
+class PlanStatus(DataTable):
+    """A row per resource of a `-json` plan or apply, updated as terraform's events arrive"""
+
+    stream = None
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.cursor_type = "row"
+        self.zebra_stripes = True
+        self.stream = EventStream()
+
+    def on_mount(self) -> None:
+        self.add_column("Resource", key="address")
+        self.add_column("Action", key="action")
+        self.add_column("Status", key="status")
+        self.add_column("Elapsed", key="elapsed")
+        # resources being applied report their progress every 10 seconds only
+        self.set_interval(1, self.tick)
+
+    def reset(self) -> None:
+        self.clear()
+        self.stream = EventStream()
+        self.app.switcher.border_subtitle = ""
+
+    def consume(self, line: str) -> "str | None":
+        """Updates the table from an event line, returns the message to show in the plan output"""
+        resource, message = self.stream.consume(line)
+        if resource is not None:
+            self.update_resource(resource)
+        return message
+
+    def update_resource(self, resource: ResourceStatus) -> None:
+        elapsed = self.stream.elapsed(resource)
+        cells = {
+            "action": resource.action,
+            "status": Text(resource.status, STATUS_STYLES[resource.status]),
+            "elapsed": "" if elapsed is None else f"{elapsed:.0f}s",
+        }
+        if resource.address in self.rows:
+            for column, value in cells.items():
+                self.update_cell(resource.address, column, value)
+        else:
+            self.add_row(resource.address, *cells.values(), key=resource.address)
+
+    def tick(self) -> None:
+        if self.app.switcher.current != "planstatus" or not self.stream.resources:
+            return
+        for address in self.stream.applying:
+            self.update_resource(self.stream.resources[address])
+        self.app.switcher.border_subtitle = self.stream.progress()
+
+    def on_hide(self) -> None:
+        self.app.switcher.border_subtitle = ""
+        if self.app.switcher.current not in PLAN_VIEWS:
+            self.app.plan.discard()
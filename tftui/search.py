@@ -0,0 +1,381 @@
+import fnmatch
+import json
+import re
+from array import array
+from tftui.debug_log import setup_logging
+
+logger = setup_logging()
+
+QUERY_FIELDS = ["type", "module", "mode", "tainted", "provider", "name", "attr"]
+QUERY_ALIASES = {"mode": {"resource": "managed"}}
+# trigram postings are 4 byte line ids, this bounds them to about 64MB
+MAX_POSTINGS = 16_000_000
+# a query that extends the previous one checks its results directly when they are this few
+NARROW_RATIO = 4
+INTERSECT_RATIO = 16
+# a token runs to the next space that is not quoted, quotes included: `zone["a b"]`
+QUERY_TOKEN = re.compile(r"""(?:"[^"]*"|'[^']*'|\S)+""")
+
+
+def trigrams(text: str) -> set[str]:
+    return {text[i : i + 3] for i in range(len(text) - 2)}
+
+
+def block_lines(fullname: str, block) -> list[str]:
+    """The distinct lines a block is found by, taken from the shared state buffer when possible"""
+    if block.resource is None and block.buffer is not None:
+        lines = block.buffer[block.start : block.end]
+    else:
+        lines = block.contents.split("\n")
+    return list(dict.fromkeys([fullname, *lines]))
+
+
+class SearchIndex:
+    """Case-insensitive substring index over the blocks of a state tree
+
+    Blocks and distinct lines are numbered: trigram postings hold line ids and every line holds
+    the ids of the blocks it appears in, so the index keeps no copy of the text it searches.
+    A lookup only verifies the few lines that contain every trigram of the query. Lines beyond
+    the postings budget, and lines too short to have a trigram, are verified on every lookup.
+    """
+
+    def __init__(self, max_postings=MAX_POSTINGS):
+        self.max_postings = max_postings
+        self.block_ids = {}
+        self.names = []
+        self.block_lines = []
+        self.line_ids = {}
+        self.lines = []
+        self.line_blocks = []
+        self.line_refs = array("I")
+        self.postings = {}
+        self.size = 0
+        self.unindexed = set()
+        self.garbage = 0
+
+    @property
+    def blocks(self) -> int:
+        return len(self.block_ids)
+
+    def build(self, state_tree: dict) -> "SearchIndex":
+        for fullname, block in state_tree.items():
+            self.add(fullname, block)
+        return self
+
+    def add(self, fullname: str, block) -> None:
+        self.add_lines(fullname, block_lines(fullname, block))
+
+    def add_lines(self, fullname: str, lines: list) -> None:
+        block_id = len(self.names)
+        self.block_ids[fullname] = block_id
+        self.names.append(fullname)
+        line_ids = array("I")
+        for line in lines:
+            line_id = self.line_ids.get(line)
+            if line_id is None:
+                line_id = self.add_line(line)
+            self.line_blocks[line_id].append(block_id)
+            self.line_refs[line_id] += 1
+            line_ids.append(line_id)
+        self.block_lines.append(line_ids)
+
+    def add_line(self, line: str) -> int:
+        line_id = len(self.lines)
+        self.line_ids[line] = line_id
+        self.lines.append(line)
+        self.line_blocks.append(array("I"))
+        self.line_refs.append(0)
+        line_trigrams = trigrams(line.lower())
+        if not line_trigrams or self.size + len(line_trigrams) > self.max_postings:
+            self.unindexed.add(line_id)
+            return line_id
+        self.size += len(line_trigrams)
+        for trigram in line_trigrams:
+            posting = self.postings.get(trigram)
+            if posting is None:
+                posting = self.postings[trigram] = array("I")
+            posting.append(line_id)
+        return line_id
+
+    def remove(self, fullname: str) -> None:
+        """Forgets a block; its ids stay behind in the postings until the index is compacted"""
+        block_id = self.block_ids.pop(fullname, None)
+        if block_id is None:
+            return
+        self.names[block_id] = None
+        for line_id in self.block_lines[block_id]:
+            self.line_refs[line_id] -= 1
+            if not self.line_refs[line_id]:
+                del self.line_ids[self.lines[line_id]]
+                self.lines[line_id] = None
+                self.unindexed.discard(line_id)
+                self.garbage += 1
+        self.block_lines[block_id] = None
+        self.garbage += 1
+
+    def update(self, state_tree: dict, added: list, removed: list, changed: list):
+        for fullname in removed + changed:
+            self.remove(fullname)
+        for fullname in added + changed:
+            self.add(fullname, state_tree[fullname])
+        if self.garbage > len(self.line_ids) + len(self.block_ids):
+            self.compact()
+
+    def compact(self) -> None:
+        """Renumbers the blocks and lines that are left, dropping the ids of removed ones"""
+        blocks = [
+            (fullname, [self.lines[line_id] for line_id in line_ids])
+            for fullname, line_ids in zip(self.names, self.block_lines)
+            if fullname is not None
+        ]
+        self.__init__(self.max_postings)
+        for fullname, lines in blocks:
+            self.add_lines(fullname, lines)
+
+    def matching_lines(self, search_string: str) -> set[int]:
+        lines = self.lines
+        if len(search_string) < 3:
+            # a short query is in most lines, so checking them all beats merging postings
+            return {
+                line_id
+                for line_id, line in enumerate(lines)
+                if line is not None and search_string in line.lower()
+            }
+        postings = sorted(
+            (self.postings.get(trigram, ()) for trigram in trigrams(search_string)),
+            key=len,
+        )
+        candidates = set(postings[0])
+        for posting in postings[1:]:
+            # verifying a few candidates is cheaper than intersecting a long posting
+            if len(candidates) * INTERSECT_RATIO < len(posting):
+                break
+            candidates.intersection_update(posting)
+        candidates |= self.unindexed
+        return {
+            line_id
+            for line_id in candidates
+            if lines[line_id] is not None and search_string in lines[line_id].lower()
+        }
+
+    def search(self, search_string: str, within: set = None) -> set[str]:
+        """Returns the names of the blocks that contain the search string
+
+        When `within` holds the results of a shorter prefix of the query, only those are checked
+        if that is cheaper than a lookup.
+        """
+        search_string = search_string.lower()
+        block_ids = self.block_ids
+        if within is not None and len(within) * NARROW_RATIO < len(block_ids):
+            lines = self.lines
+            return {
+                fullname
+                for fullname in within
+                if fullname in block_ids
+                and any(
+                    search_string in lines[line_id].lower()
+                    for line_id in self.block_lines[block_ids[fullname]]
+                )
+            }
+        line_ids = self.matching_lines(search_string)
+        if len(line_ids) * NARROW_RATIO > len(block_ids):
+            matches = {
+                fullname
+                for fullname, block_line_ids in zip(self.names, self.block_lines)
+                if fullname is not None and not line_ids.isdisjoint(block_line_ids)
+            }
+        else:
+            names = self.names
+            matches = {
+                names[block_id]
+                for line_id in line_ids
+                for block_id in self.line_blocks[line_id]
+            }
+            matches.discard(None)
+        if within is not None:
+            matches &= within
+        return matches
+
+
+def module_key(module: str) -> str:
+    """`module.network.module.vpc` is queried as `network.vpc`"""
+    return ".".join(part for part in module.split(".") if part != "module").lower()
+
+
+def unquote(text: str) -> str:
+    if len(text) > 1 and text[0] == text[-1] and text[0] in "\"'":
+        return text[1:-1]
+    return text
+
+
+def is_pattern(value: str) -> bool:
+    return "*" in value or "?" in value
+
+
+def match_keys(keys, pattern: str) -> list:
+    """The keys matching a wildcard pattern, in which brackets are literal as in addresses"""
+    return fnmatch.filter(keys, pattern.replace("[", "[[]"))
+
+
+def parse_query(query: str) -> tuple[list, list]:
+    """Splits a query into (negated, field, value) filters and free text terms
+
+    A query without any field filter is a single free text term, spaces included. Quotes within
+    a value are kept, e.g. `module:dns.zone["zone-3"]`, and only a fully quoted value loses them.
+    """
+    filters = []
+    terms = []
+    for token in QUERY_TOKEN.findall(query):
+        negated = token.startswith("-") and len(token) > 1
+        field, separator, value = token.lstrip("-").partition(":")
+        if separator and field.lower() in QUERY_FIELDS:
+            filters.append((negated, field.lower(), unquote(value).lower()))
+        else:
+            terms.append(unquote(token))
+    if not filters:
+        return ([], [query] if query else [])
+    return (filters, terms)
+
+
+class FieldIndex:
+    """Block names per value of each queryable field, so filters are answered by set operations"""
+
+    def __init__(self):
+        self.fields = {field: {} for field in QUERY_FIELDS if field != "attr"}
+        self.block_values = {}
+
+    def build(self, state_tree: dict) -> "FieldIndex":
+        for fullname, block in state_tree.items():
+            self.add(fullname, block)
+        return self
+
+    def add(self, fullname: str, block) -> None:
+        values = {
+            "type": block.address.type.lower(),
+            "module": module_key(block.address.module),
+            "mode": block.address.mode,
+            "tainted": "true" if block.is_tainted else "false",
+            "provider": block.provider.lower(),
+            "name": block.address.name.lower(),
+        }
+        self.block_values[fullname] = values
+        for field, value in values.items():
+            self.fields[field].setdefault(value, set()).add(fullname)
+
+    def remove(self, fullname: str) -> None:
+        for field, value in self.block_values.pop(fullname, {}).items():
+            blocks = self.fields[field][value]
+            blocks.discard(fullname)
+            if not blocks:
+                del self.fields[field][value]
+
+    def update(self, state_tree: dict, added: list, removed: list, changed: list):
+        for fullname in removed + changed:
+            self.remove(fullname)
+        for fullname in added + changed:
+            self.add(fullname, state_tree[fullname])
+
+    def lookup(self, field: str, value: str) -> set[str]:
+        value = QUERY_ALIASES.get(field, {}).get(value, value)
+        if field == "module":
+            value = module_key(value)
+        index = self.fields[field]
+        if not is_pattern(value):
+            return index.get(value, set())
+        patterns = [value]
+        # `module:net.*` is module net and everything below it
+        if field == "module" and value.endswith(".*"):
+            patterns.append(value[:-2])
+        matches = set()
+        for pattern in patterns:
+            for key in match_keys(index.keys(), pattern):
+                matches |= index[key]
+        return matches
+
+    def query(self, filters: list, attributes=None) -> "set[str] | None":
+        """Intersects the positive filters and subtracts the negated ones; None means all blocks"""
+
+        def lookup(field, value):
+            if field != "attr":
+                return self.lookup(field, value)
+            return attributes.lookup(value) if attributes is not None else set()
+
+        included = sorted(
+            (lookup(field, value) for negated, field, value in filters if not negated),
+            key=len,
+        )
+        matches = set(included[0]) if included else None
+        for blocks in included[1:]:
+            matches &= blocks
+        for negated, field, value in filters:
+            if negated:
+                if matches is None:
+                    matches = set(self.block_values)
+                matches -= lookup(field, value)
+        return matches
+
+
+def attribute_value(value) -> str:
+    """Renders a scalar the way it is written in a query, e.g. `true`, `null` or `3`"""
+    if isinstance(value, str):
+        return value.lower()
+    return json.dumps(value)
+
+
+class AttributeIndex:
+    """Block names per attribute path and value, e.g. `versioning.enabled` -> `false`
+
+    List indexes are left out of the paths, and sensitive values are never indexed.
+    """
+
+    def __init__(self):
+        self.paths = {}
+
+    def build(self, resources) -> "AttributeIndex":
+        """Indexes (fullname, resource) pairs whose resources hold json state `values`"""
+        for fullname, resource in resources:
+            self.add(
+                fullname,
+                resource.get("values") or {},
+                resource.get("sensitive_values") or {},
+            )
+        return self
+
+    def add(self, fullname: str, values, sensitive, path="") -> None:
+        if sensitive is True:
+            return
+        if isinstance(values, dict):
+            sensitive = sensitive if isinstance(sensitive, dict) else {}
+            for key, value in values.items():
+                self.add(
+                    fullname,
+                    value,
+                    sensitive.get(key),
+                    f"{path}.{key.lower()}" if path else key.lower(),
+                )
+        elif isinstance(values, list):
+            sensitive = sensitive if isinstance(sensitive, list) else []
+            for i, value in enumerate(values):
+                self.add(
+                    fullname,
+                    value,
+                    sensitive[i] if i < len(sensitive) else None,
+                    path,
+                )
+        else:
+            self.paths.setdefault(path, {}).setdefault(
+                attribute_value(values), set()
+            ).add(fullname)
+
+    def lookup(self, query: str) -> set[str]:
+        """Answers `path=value`; a value with wildcards, or no value at all, scans the path's values"""
+        path, separator, value = query.lower().partition("=")
+        values = self.paths.get(path, {})
+        if not separator:
+            value = "*"
+        if not is_pattern(value):
+            return values.get(value, set())
+        matches = set()
+        for key in match_keys(values.keys(), value):
+            matches |= values[key]
+        return matches
@@ -1,29 +1,23 @@
 import asyncio
+import functools
+import os
 import re
+import sys
 import logging
 import json
 from collections import Counter
+from tftui.cache import current_workspace, local_state_path, read_state_header
+from tftui.commands import Command, execute_async
 from tftui.debug_log import setup_logging
 
 logger = setup_logging()
 
-
-async def execute_async(*command: str) -> tuple[str, str]:
-    command = [word for phrase in command for word in phrase.split()]
-
-    proc = await asyncio.create_subprocess_exec(
-        *command,
-        stdout=asyncio.subprocess.PIPE,
-        stderr=asyncio.subprocess.STDOUT,
-    )
-
-    stdout, strerr = await proc.communicate()
-    response = stdout.decode("utf-8")
-    logger.debug(
-        "Executed command: %s",
-        json.dumps({"command": command, "return_code": proc.returncode}, indent=2),
-    )
-    return (proc.returncode, response)
+ADDRESS_CACHE_SIZE = 256 * 1024
+parsed_addresses = {}
+# short lines ("}", "tags = {", ...) repeat all over a state and are interned to share memory
+INTERN_MAX_LINE_LENGTH = 64
+STREAM_BATCH_SIZE = 500
+STREAM_BATCH_INTERVAL = 0.1
 
 
 def extract_sensitive_values(stateTree: dict) -> dict[str, dict[str, str]]:
@@ -49,75 +43,620 @@ def extract_sensitive_values(stateTree: dict) -> dict[str, dict[str, str]]:
     return sensitive_values
 
 
-def split_resource_name(fullname: str) -> list[str]:
-    # Thanks Chatgpt, couldn't do this without you; please don't become sentient and kill us all
-    pattern = r"\.(?=(?:[^\[\]]*\[[^\[\]]*\])*[^\[\]]*$)"
-    return re.split(pattern, fullname)
+def sensitive_child(sensitive, key):
+    if isinstance(sensitive, dict):
+        return sensitive.get(key)
+    if isinstance(sensitive, list) and isinstance(key, int) and key < len(sensitive):
+        return sensitive[key]
+    return None
+
+
+def render_value(value, sensitive, indent: int) -> str:
+    if sensitive is True:
+        return "(sensitive value)"
+    padding = " " * indent
+    if isinstance(value, dict):
+        if not value:
+            return "{}"
+        width = max(len(json.dumps(key)) for key in value)
+        lines = [
+            f"{padding}    {json.dumps(key):<{width}} = "
+            + render_value(item, sensitive_child(sensitive, key), indent + 4)
+            for key, item in value.items()
+            if item is not None
+        ]
+        return "{\n" + "\n".join(lines) + f"\n{padding}}}"
+    if isinstance(value, list):
+        if not value:
+            return "[]"
+        lines = [
+            f"{padding}    "
+            + render_value(item, sensitive_child(sensitive, i), indent + 4)
+            + ","
+            for i, item in enumerate(value)
+        ]
+        return "[\n" + "\n".join(lines) + f"\n{padding}]"
+    if isinstance(value, str) and "\n" in value.rstrip("\n"):
+        lines = [f"{padding}    {line}" for line in value.rstrip("\n").split("\n")]
+        return "<<-EOT\n" + "\n".join(lines) + f"\n{padding}EOT"
+    return json.dumps(value)
+
+
+def render_resource(resource: dict) -> str:
+    """Renders a `show -json` resource the way `terraform show` prints it"""
+    keyword = "data" if resource.get("mode") == "data" else "resource"
+    values = resource.get("values") or {}
+    sensitive = resource.get("sensitive_values") or {}
+    attributes = {key: value for key, value in values.items() if value is not None}
+    width = max((len(key) for key in attributes), default=0)
+    lines = [f'{keyword} "{resource.get("type")}" "{resource.get("name")}" {{']
+    for key, value in attributes.items():
+        lines.append(
+            f"    {key:<{width}} = {render_value(value, sensitive_child(sensitive, key), 4)}"
+        )
+    lines.append("}")
+    return "\n".join(lines) + "\n"
+
+
+def iterate_json_resources(module: dict):
+    for resource in module.get("resources", []):
+        yield (module.get("address", ""), resource)
+    for child_module in module.get("child_modules", []):
+        yield from iterate_json_resources(child_module)
+
+
+def sensitive_paths_to_values(paths: list) -> dict:
+    """Converts raw state `sensitive_attributes` paths to the `show -json` sensitive_values shape"""
+    sensitive_values = {}
+    for path in paths:
+        steps = [step.get("value") for step in path]
+        steps = [
+            step.get("value") if isinstance(step, dict) else step for step in steps
+        ]
+        if not steps:
+            continue
+        node = sensitive_values
+        for step in steps[:-1]:
+            child = node.get(step)
+            if not isinstance(child, dict):
+                child = node[step] = {}
+            node = child
+        node[steps[-1]] = True
+    return sensitive_values
+
+
+def provider_name(provider: str) -> "str | None":
+    """Shortens `provider["registry.terraform.io/hashicorp/aws"].alias` to `aws.alias`"""
+    if not provider:
+        return None
+    match = re.search(r'provider\["([^"]+)"\](?:\.(\w+))?$', provider)
+    source, alias = match.groups() if match else (provider, None)
+    name = source.split("/")[-1]
+    return f"{name}.{alias}" if alias else name
+
+
+def intern_line(line: str) -> str:
+    return sys.intern(line) if len(line) <= INTERN_MAX_LINE_LENGTH else line
+
+
+def split_address(address: str) -> list[str]:
+    """Splits an address on the dots that are outside of index brackets and quoted keys"""
+    parts = []
+    start = 0
+    depth = 0
+    quoted = False
+    escaped = False
+    for i, char in enumerate(address):
+        if escaped:
+            escaped = False
+        elif quoted:
+            if char == "\\":
+                escaped = True
+            elif char == '"':
+                quoted = False
+        elif char == '"':
+            quoted = True
+        elif char == "[":
+            depth += 1
+        elif char == "]":
+            depth -= 1
+        elif char == "." and depth == 0:
+            parts.append(address[start:i])
+            start = i + 1
+    parts.append(address[start:])
+    return parts
+
+
+def split_index_key(part: str) -> tuple:
+    """Splits `name["key"]` or `name[0]` into the name and its string, number or None key"""
+    if not part.endswith("]") or "[" not in part:
+        return (part, None)
+    name, key = part[: part.index("[")], part[part.index("[") + 1 : -1]
+    if key.startswith('"'):
+        return (name, json.loads(key))
+    return (name, int(key))
+
+
+class ResourceAddress:
+    MODE_MANAGED = "managed"
+    MODE_DATA = "data"
+
+    __slots__ = ("module_path", "module", "mode", "type", "name", "key", "fullname")
+
+    def __init__(
+        self,
+        module_path: tuple,
+        mode: str,
+        type: str,
+        name: str,
+        key=None,
+        fullname: str = None,
+    ):
+        self.module_path = module_path
+        self.module = sys.intern(".".join(module_path))
+        self.mode = mode
+        self.type = sys.intern(type)
+        self.name = sys.intern(name)
+        self.key = key
+        self.fullname = fullname or ".".join(module_path + (self.resource,))
+
+    @property
+    def resource(self) -> str:
+        """The address relative to its module, e.g. `data.aws_ami.this` or `aws_instance.web[0]`"""
+        resource = f"{self.type}.{self.name}"
+        if self.mode == ResourceAddress.MODE_DATA:
+            resource = f"data.{resource}"
+        if isinstance(self.key, str):
+            resource += f"[{json.dumps(self.key, ensure_ascii=False)}]"
+        elif self.key is not None:
+            resource += f"[{self.key}]"
+        return resource
+
+    def __str__(self) -> str:
+        return self.fullname
+
+    def __repr__(self) -> str:
+        return f"ResourceAddress({self.fullname!r})"
+
+
+@functools.lru_cache(maxsize=ADDRESS_CACHE_SIZE)
+def parse_module_path(module: str) -> tuple:
+    if not module:
+        return ()
+    parts = split_address(module)
+    return tuple(
+        sys.intern(f"{parts[i]}.{parts[i + 1]}") for i in range(0, len(parts) - 1, 2)
+    )
+
+
+def parse_address(address: str) -> ResourceAddress:
+    """Parses an address, memoized since the same addresses come back on every refresh and search"""
+    parsed = parsed_addresses.get(address)
+    if parsed is not None:
+        return parsed
+    if len(parsed_addresses) >= ADDRESS_CACHE_SIZE:
+        parsed_addresses.clear()
+
+    parts = split_address(address)
+    module_path = []
+    i = 0
+    while parts[i] == "module" and i + 2 < len(parts):
+        module_path.append(sys.intern(f"module.{parts[i + 1]}"))
+        i += 2
+    mode = ResourceAddress.MODE_MANAGED
+    if parts[i] == "data" and i + 2 < len(parts):
+        mode = ResourceAddress.MODE_DATA
+        i += 1
+    name, key = split_index_key(".".join(parts[i + 1 :]))
+    parsed = ResourceAddress(tuple(module_path), mode, parts[i], name, key, address)
+    parsed_addresses[address] = parsed
+    return parsed
 
 
 class Block:
     TYPE_RESOURCE = "resource"
     TYPE_DATASOURCE = "data"
 
-    type = None
-    name = None
-    submodule = None
-    contents = ""
-    is_tainted = False
+    __slots__ = (
+        "address",
+        "is_tainted",
+        "buffer",
+        "start",
+        "end",
+        "resource",
+        "content_hash",
+    )
 
-    def __init__(self, submodule: str, name: str, type: str, is_tainted: bool):
-        self.type = type
-        self.name = name
-        self.submodule = submodule
+    def __init__(
+        self,
+        address: ResourceAddress,
+        is_tainted: bool,
+        buffer: list = None,
+        start=0,
+        end=0,
+        resource: dict = None,
+    ):
+        self.address = address
         self.is_tainted = is_tainted
+        self.buffer = buffer
+        self.start = start
+        self.end = end
+        self.resource = resource
+        self.content_hash = None
+
+    @property
+    def type(self) -> str:
+        if self.address.mode == ResourceAddress.MODE_DATA:
+            return Block.TYPE_DATASOURCE
+        return Block.TYPE_RESOURCE
+
+    @property
+    def name(self) -> str:
+        return self.address.resource
+
+    @property
+    def submodule(self) -> str:
+        return self.address.module
+
+    @property
+    def contents(self) -> str:
+        # the text is only assembled when a block is actually viewed or searched
+        if self.resource is not None:
+            return render_resource(self.resource)
+        if self.buffer is None:
+            return ""
+        return "\n".join(self.buffer[self.start : self.end]) + "\n"
+
+    @property
+    def provider(self) -> str:
+        """The short provider name with its alias, e.g. `aws` or `aws.us_east_1`"""
+        if self.resource is not None:
+            provider = provider_name(
+                self.resource.get("provider") or self.resource.get("provider_name")
+            )
+            if provider:
+                return provider
+        # without a provider reference terraform's own default applies: the type's prefix
+        return self.address.type.split("_")[0]
+
+    @property
+    def digest(self) -> int:
+        if self.content_hash is None:
+            self.content_hash = hash((self.is_tainted, self.contents))
+        return self.content_hash
+
+    def differs(self, other: "Block") -> bool:
+        """Whether the block of the same address in another state shows something else"""
+        if self.is_tainted != other.is_tainted:
+            return True
+        # json and pulled resources are compared as data, rendering them takes far longer
+        if self.resource is not None or other.resource is not None:
+            return self.resource != other.resource
+        return self.digest != other.digest
+
+
+def diff_state_trees(old: dict, new: dict) -> tuple[list, list, list]:
+    """Returns the (added, removed, changed) block names between two state trees"""
+    added = [fullname for fullname in new if fullname not in old]
+    removed = [fullname for fullname in old if fullname not in new]
+    changed = [
+        fullname
+        for fullname, block in new.items()
+        if fullname in old and old[fullname].differs(block)
+    ]
+    return (added, removed, changed)
+
+
+class StateParser:
+    """Turns `terraform show -no-color` output into blocks, one line at a time
+
+    The lines of all blocks are kept once in a shared buffer; blocks only hold their offsets.
+    """
+
+    def __init__(self, buffer: list):
+        self.header = None
+        self.buffer = buffer
+        self.start = 0
+        self.leftovers = []
+
+    def feed(self, line: str) -> "tuple[str, Block] | None":
+        if line.startswith("#"):
+            self.header = State.parse_block(line.rstrip())
+            self.start = len(self.buffer)
+        elif self.header is None:
+            self.leftovers.append(line.rstrip())
+        elif line.startswith("}"):
+            self.buffer.append(intern_line(line.rstrip()))
+            (address, is_tainted) = self.header
+            block = Block(
+                address,
+                is_tainted,
+                self.buffer,
+                self.start,
+                len(self.buffer),
+            )
+            self.header = None
+            return (address.fullname, block)
+        else:
+            self.buffer.append(intern_line(line.rstrip()))
+        return None
 
 
 class State:
+    SOURCE_SHOW = "show"
+    SOURCE_JSON = "json"
+    SOURCE_PULL = "pull"
+    SOURCES = [SOURCE_SHOW, SOURCE_JSON, SOURCE_PULL]
+
     state_tree = {}
+    sensitive_values = {}
+    serial = None
+    lineage = None
+    workspace = None
+    buffer = []
     executable = ""
     no_init = False
+    source = SOURCE_SHOW
+    cache = None
+    from_cache = False
 
-    def __init__(self, executable="terraform", no_init=False):
+    def __init__(
+        self, executable="terraform", no_init=False, source=SOURCE_SHOW, cache=None
+    ):
         self.executable = executable
         self.no_init = no_init
+        self.source = source
+        self.cache = cache
 
-    def parse_block(line: str) -> tuple[str, str, str]:
+    def parse_block(line: str) -> tuple[ResourceAddress, bool]:
         fullname = line[2 : line.rindex(":")]
         is_tainted = line.endswith("(tainted)")
-        parts = split_resource_name(fullname)
-        if fullname.startswith("data") or ".data." in fullname:
-            name = ".".join(parts[-3:])
-            submodule = ".".join(parts[:-3])
-            type = Block.TYPE_DATASOURCE
+        return (parse_address(fullname), is_tainted)
+
+    async def stream_state(self, changed=False):
+        """Yields batches of (fullname, block) as the state is being loaded
+
+        `changed` tells that the state was just written (e.g. by a taint or an apply), so a remote
+        state isn't pulled only to find out that its serial is not in the cache.
+        """
+        self.state_tree = {}
+        self.sensitive_values = {}
+        self.buffer = []
+        self.serial = None
+        self.lineage = None
+        self.from_cache = False
+        self.workspace = current_workspace()
+        if self.cache is not None and self.source != State.SOURCE_PULL:
+            self.lineage, self.serial = await self.probe_serial(pull=not changed)
+            entry = (
+                self.cache.load(self.workspace, self.lineage, self.serial, self.source)
+                if self.serial is not None
+                else None
+            )
+            if entry is not None:
+                logger.debug("Loading state from cache (serial %s)", self.serial)
+                self.restore(entry)
+                self.from_cache = True
+                blocks = list(self.state_tree.items())
+                for i in range(0, len(blocks), STREAM_BATCH_SIZE):
+                    yield blocks[i : i + STREAM_BATCH_SIZE]
+                return
+
+        if self.source == State.SOURCE_JSON:
+            batches = self.load_json_state()
+        elif self.source == State.SOURCE_PULL:
+            batches = self.load_pulled_state()
         else:
-            name = ".".join(parts[-2:])
-            submodule = ".".join(parts[:-2])
-            type = Block.TYPE_RESOURCE
+            batches = self.stream_show_output()
+        async for batch in batches:
+            yield batch
+        self.log_blocks()
 
-        return (fullname, name, submodule, type, is_tainted)
+    async def probe_serial(self, pull=True) -> tuple:
+        """Returns the (lineage, serial) of the current state, as cheaply as possible
 
-    async def refresh_state(self) -> None:
-        returncode, stdout = await execute_async(self.executable, "show -no-color")
+        A remote state is only pulled if `pull` is set, otherwise the last loaded serial is returned.
+        """
+        try:
+            path = local_state_path(self.workspace or current_workspace())
+            if path is not None and os.path.exists(path):
+                return read_state_header(path)
+            if not pull:
+                return (self.lineage, self.serial)
+            returncode, stdout = await execute_async(
+                self.executable, "state", "pull", priority=Command.INTERACTIVE
+            )
+            if returncode == 0 and stdout.strip():
+                document = json.loads(stdout)
+                return (document.get("lineage"), document.get("serial"))
+        except Exception as e:
+            logger.debug("Unable to probe the state serial: %s", e)
+        return (None, None)
+
+    def serialize(self) -> dict:
+        return {
+            "blocks": [
+                [
+                    fullname,
+                    block.is_tainted,
+                    block.contents if block.resource is None else None,
+                    block.resource,
+                ]
+                for fullname, block in self.state_tree.items()
+            ],
+            "sensitive_values": self.sensitive_values,
+        }
+
+    def restore(self, entry: dict) -> None:
+        self.state_tree = {}
+        self.buffer = []
+        for fullname, is_tainted, contents, resource in entry["blocks"]:
+            start = len(self.buffer)
+            if contents is not None:
+                self.buffer.extend(
+                    intern_line(line) for line in contents.split("\n")[:-1]
+                )
+            self.state_tree[fullname] = Block(
+                parse_address(fullname),
+                is_tainted,
+                self.buffer,
+                start,
+                len(self.buffer),
+                resource,
+            )
+        self.sensitive_values = entry["sensitive_values"]
+
+    def load_snapshot(self) -> bool:
+        """Restores the last cached state of the workspace, which may be outdated"""
+        if self.cache is None:
+            return False
+        self.workspace = current_workspace()
+        entry = self.cache.load_latest(self.workspace, self.source)
+        if entry is None:
+            return False
+        self.restore(entry)
+        self.lineage, self.serial = (entry["lineage"], entry["serial"])
+        self.from_cache = True
+        return True
+
+    def store_cache(self) -> None:
+        # a pulled state is never loaded from the cache, but is kept as the next pull launch's snapshot
+        if self.cache is None or self.from_cache or self.serial is None:
+            return
+        workspace, lineage, serial = (self.workspace, self.lineage, self.serial)
+        self.cache.store(workspace, lineage, serial, self.source, self.serialize())
+
+    async def load_json_state(self):
+        """Builds the blocks and the sensitive values from a single `terraform show -json`"""
+        returncode, stdout = await execute_async(
+            self.executable, "show", "-json", priority=Command.INTERACTIVE
+        )
         if returncode != 0:
             raise Exception(stdout)
 
-        self.state_tree = {}
-        state_output = stdout.splitlines()
-        logger.debug(f"state show line count: {len(state_output)}")
-
-        contents = ""
-        for line in state_output:
-            if line.startswith("#"):
-                (fullname, name, submodule, type, is_tainted) = State.parse_block(line)
-                contents = ""
-            elif line.startswith("}"):
-                contents += line.rstrip() + "\n"
-                block = Block(submodule, name, type, is_tainted)
-                block.contents = contents
+        document = json.loads(stdout)
+        del stdout
+        self.sensitive_values = extract_sensitive_values(document)
+
+        batch = []
+        for module_address, resource in iterate_json_resources(
+            document.get("values", {}).get("root_module", {})
+        ):
+            address = ResourceAddress(
+                parse_module_path(module_address),
+                resource.get("mode", ResourceAddress.MODE_MANAGED),
+                resource["type"],
+                resource["name"],
+                resource.get("index"),
+            )
+            fullname = address.fullname
+            block = Block(address, resource.get("tainted", False), resource=resource)
+            self.state_tree[fullname] = block
+            batch.append((fullname, block))
+            if len(batch) >= STREAM_BATCH_SIZE:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    async def load_pulled_state(self):
+        """Builds the blocks from `terraform state pull`, which doesn't load any provider schemas"""
+        returncode, stdout = await execute_async(
+            self.executable, "state", "pull", priority=Command.INTERACTIVE
+        )
+        if returncode != 0:
+            raise Exception(stdout)
+        if not stdout.strip():
+            return
+
+        document = json.loads(stdout)
+        del stdout
+        self.serial = document.get("serial")
+        self.lineage = document.get("lineage")
+
+        batch = []
+        for resource in document.get("resources", []):
+            module_address = resource.get("module", "")
+            for instance in resource.get("instances", []):
+                if instance.get("deposed"):
+                    continue
+                address = ResourceAddress(
+                    parse_module_path(module_address),
+                    resource.get("mode", ResourceAddress.MODE_MANAGED),
+                    resource["type"],
+                    resource["name"],
+                    instance.get("index_key"),
+                )
+                fullname = address.fullname
+                sensitive_values = sensitive_paths_to_values(
+                    instance.get("sensitive_attributes") or []
+                )
+                attributes = instance.get("attributes") or {}
+                secrets = {
+                    key: attributes.get(key)
+                    for key, value in sensitive_values.items()
+                    if value is True
+                }
+                if secrets:
+                    self.sensitive_values[fullname] = secrets
+                block = Block(
+                    address,
+                    instance.get("status") == "tainted",
+                    resource={
+                        "mode": resource.get("mode"),
+                        "type": resource["type"],
+                        "name": resource["name"],
+                        "provider": resource.get("provider"),
+                        "values": attributes,
+                        "sensitive_values": sensitive_values,
+                    },
+                )
                 self.state_tree[fullname] = block
-            else:
-                contents += line.rstrip() + "\n"
+                batch.append((fullname, block))
+                if len(batch) >= STREAM_BATCH_SIZE:
+                    yield batch
+                    batch = []
+        if batch:
+            yield batch
+
+    async def stream_show_output(self):
+        """Yields batches of (fullname, block) while `terraform show` is still running"""
+        parser = StateParser(self.buffer)
+        batch = []
+        line_count = 0
+
+        command = Command(
+            self.executable, "show", "-no-color", priority=Command.INTERACTIVE
+        )
+        loop = asyncio.get_running_loop()
+        last_batch_time = loop.time()
+
+        async for line in command.lines():
+            line_count += 1
+            parsed = parser.feed(line)
+            if parsed is None:
+                continue
+            self.state_tree[parsed[0]] = parsed[1]
+            batch.append(parsed)
+            if (
+                len(batch) >= STREAM_BATCH_SIZE
+                or loop.time() - last_batch_time > STREAM_BATCH_INTERVAL
+            ):
+                yield batch
+                batch = []
+                last_batch_time = loop.time()
+        if command.returncode != 0:
+            raise Exception("\n".join(parser.leftovers))
+
+        logger.debug(f"state show line count: {line_count}")
+        if batch:
+            yield batch
+
+    async def refresh_state(self) -> None:
+        async for _ in self.stream_state():
+            pass
 
+    def log_blocks(self) -> None:
         if logger.isEnabledFor(logging.DEBUG):
             for key, block in self.state_tree.items():
                 logger.debug(
@@ -127,7 +666,7 @@ class State:
                             "fullname": key,
                             "module": block.submodule,
                             "name": block.name,
-                            "lines": block.contents.count("\n"),
+                            "lines": block.end - block.start,
                             "tainted": block.is_tainted,
                         },
                         indent=2,
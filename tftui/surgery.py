@@ -0,0 +1,220 @@
+import copy
+import json
+import os
+import tempfile
+import time
+from tftui.commands import Command, execute_async
+from tftui.state import ResourceAddress, parse_address
+from tftui.debug_log import setup_logging
+
+logger = setup_logging()
+
+
+class StateSurgery:
+    """Applies many rm/taint/untaint/mv operations to a single pulled state and pushes it once
+
+    Every `terraform state rm` or `taint` takes the lock, reads and writes the whole state and
+    bumps its serial, so editing hundreds of resources one by one is slow on remote backends.
+    """
+
+    RM = "rm"
+    TAINT = "taint"
+    UNTAINT = "untaint"
+    MV = "mv"
+    ACTIONS = [RM, TAINT, UNTAINT, MV]
+
+    def __init__(self, executable="terraform"):
+        self.executable = executable
+        self.document = None
+        self.result = None
+        self.operations = []
+
+    async def pull(self) -> None:
+        returncode, stdout = await execute_async(
+            self.executable, "state", "pull", priority=Command.INTERACTIVE
+        )
+        if returncode != 0:
+            raise Exception(stdout)
+        if not stdout.strip():
+            raise Exception("The state is empty")
+        self.document = json.loads(stdout)
+
+    def add(self, action: str, address: str, destination: str = None) -> None:
+        if action not in StateSurgery.ACTIONS:
+            raise ValueError(f"Unknown state operation: {action}")
+        if (action == StateSurgery.MV) != (destination is not None):
+            raise ValueError(f"Only {StateSurgery.MV} takes a destination: {address}")
+        self.operations.append((action, address, destination))
+
+    def apply(self) -> dict:
+        """Applies the operations to a copy of the pulled state; raises with all invalid operations"""
+        state = EditableState(copy.deepcopy(self.document))
+        errors = []
+        for action, address, destination in self.operations:
+            try:
+                state.apply(action, address, destination)
+            except ValueError as e:
+                errors.append(f"{action} {address}: {e}")
+        if errors:
+            raise ValueError("\n".join(errors))
+        document = state.to_document()
+        document["serial"] = self.document.get("serial", 0) + 1
+        self.result = document
+        return document
+
+    def dry_run(self) -> list[str]:
+        """Describes the changes the push would make, one line per operation plus a summary"""
+        if self.result is None:
+            self.apply()
+        lines = []
+        for action, address, destination in self.operations:
+            if action == StateSurgery.MV:
+                lines.append(f"{action} {address} -> {destination}")
+            else:
+                lines.append(f"{action} {address}")
+        lines.append(
+            f"{count_instances(self.document)} instances -> {count_instances(self.result)} instances, "
+            f"serial {self.document.get('serial')} -> {self.result['serial']} (lineage {self.result.get('lineage')})"
+        )
+        return lines
+
+    def backup(self) -> str:
+        path = f"terraform.tfstate.{int(time.time())}.backup"
+        with open(path, "w") as file:
+            json.dump(self.document, file, indent=2)
+        return path
+
+    async def push(self) -> str:
+        """Backs up the pulled state and pushes the edited one; returns the backup's path"""
+        if self.result is None:
+            self.apply()
+        backup = self.backup()
+        # terraform refuses to push over a state whose lineage differs or whose serial moved on
+        file, path = tempfile.mkstemp(suffix=".tfstate")
+        try:
+            with os.fdopen(file, "w") as state_file:
+                json.dump(self.result, state_file, indent=2)
+            returncode, stdout = await execute_async(
+                self.executable, "state", "push", path, priority=Command.INTERACTIVE
+            )
+        finally:
+            os.remove(path)
+        if returncode != 0:
+            raise Exception(stdout)
+        logger.debug(
+            "State surgery: %s",
+            json.dumps(
+                {
+                    "operations": len(self.operations),
+                    "serial": self.result["serial"],
+                    "backup": backup,
+                },
+                indent=2,
+            ),
+        )
+        return backup
+
+
+def resource_key(resource: dict) -> tuple:
+    return (
+        resource.get("module", ""),
+        resource.get("mode", ResourceAddress.MODE_MANAGED),
+        resource["type"],
+        resource["name"],
+    )
+
+
+def address_key(address: ResourceAddress) -> tuple:
+    return (address.module, address.mode, address.type, address.name)
+
+
+class EditableState:
+    """A pulled state indexed by resource and instance key, so every operation is a dict lookup"""
+
+    def __init__(self, document: dict):
+        self.document = document
+        self.resources = {}
+        self.instances = {}
+        for resource in document.get("resources", []):
+            key = resource_key(resource)
+            self.resources[key] = resource
+            self.instances[key] = {}
+            for instance in resource["instances"]:
+                self.insert(key, instance)
+
+    def insert(self, key: tuple, instance: dict) -> None:
+        self.instances[key].setdefault(instance.get("index_key"), []).append(instance)
+
+    def find(self, address: ResourceAddress) -> list:
+        """Returns the instance objects of an address; no index key means all of them"""
+        instances = self.instances.get(address_key(address), {})
+        if address.key is None:
+            return [instance for objects in instances.values() for instance in objects]
+        return list(instances.get(address.key, []))
+
+    def apply(self, action: str, address: str, destination=None) -> None:
+        source = parse_address(address)
+        instances = self.find(source)
+        if not instances:
+            raise ValueError("no such resource instance in the state")
+        key = address_key(source)
+
+        if action == StateSurgery.RM:
+            for instance in instances:
+                self.instances[key].pop(instance.get("index_key"), None)
+            return
+
+        if action in (StateSurgery.TAINT, StateSurgery.UNTAINT):
+            if source.mode == ResourceAddress.MODE_DATA:
+                raise ValueError("data sources can't be tainted")
+            current = [instance for instance in instances if "deposed" not in instance]
+            if len(current) > 1:
+                raise ValueError("the address matches several instances")
+            for instance in current:
+                if action == StateSurgery.TAINT:
+                    instance["status"] = "tainted"
+                elif instance.get("status") != "tainted":
+                    raise ValueError("the instance is not tainted")
+                else:
+                    del instance["status"]
+            return
+
+        target = parse_address(destination)
+        if (target.mode, target.type) != (source.mode, source.type):
+            raise ValueError(f"can't move to a resource of another type: {destination}")
+        if (source.key is None) != (target.key is None):
+            raise ValueError(
+                f"a resource and a resource instance can't be moved into each other: {destination}"
+            )
+        if self.find(target):
+            raise ValueError(f"the destination already exists: {destination}")
+        target_key = address_key(target)
+        if target_key not in self.resources:
+            resource = dict(self.resources[key], name=target.name, instances=[])
+            resource.pop("module", None)
+            if target.module:
+                resource["module"] = target.module
+            self.resources[target_key] = resource
+            self.instances[target_key] = {}
+        for instance in instances:
+            self.instances[key].pop(instance.get("index_key"), None)
+            if target.key is not None:
+                instance["index_key"] = target.key
+            self.insert(target_key, instance)
+
+    def to_document(self) -> dict:
+        resources = []
+        for key, resource in self.resources.items():
+            resource["instances"] = [
+                instance
+                for objects in self.instances[key].values()
+                for instance in objects
+            ]
+            if resource["instances"]:
+                resources.append(resource)
+        self.document["resources"] = resources
+        return self.document
+
+
+def count_instances(document: dict) -> int:
+    return sum(len(resource["instances"]) for resource in document.get("resources", []))